@@ -7,66 +7,433 @@ Flask API для системы детекции мошенничества.
 - Получения информации о модели (/model-info)
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+from flask_caching import Cache
 from flask_cors import CORS
+import atexit
+import functools
 import os
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-import traceback
-from app.llm import explain_transaction, llm_available
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.llm import explain_transaction, explain_transaction_stream, llm_available
 from app.enhanced_llm import (
     get_enhanced_explanation, find_similar_transactions, 
     analyze_transaction_anomalies, get_risk_recommendations,
     save_transaction_feedback
 )
-from app.chatbot import chat_with_bot, get_chatbot_stats, clear_chatbot_session
+from app.chatbot import chat_with_bot, chat_batch_with_bot, get_chatbot_stats, clear_chatbot_session
 
 try:
-    from app.inference import get_model, validate_and_predict
+    from app.inference import get_model
     from app.preprocess import DataPreprocessor
 except ImportError as e:
     raise ImportError(
         f"Ошибка импорта: {e}. Запускайте сервер как пакет: 'python -m app.api' из корня проекта."
     )
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Настройка логирования: запросы только кладут записи в очередь,
+# запись в stderr выполняет фоновый поток QueueListener
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_queue_handler = QueueHandler(queue.SimpleQueue())
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+_log_listener: Optional[QueueListener] = None
+
+def _start_log_listener():
+    """Запуск фонового потока логирования (заново в каждом процессе после fork gunicorn)."""
+    global _log_listener
+    log_queue = queue.SimpleQueue()
+    _log_queue_handler.queue = log_queue
+    _log_listener = QueueListener(log_queue, _log_stream_handler, respect_handler_level=True)
+    _log_listener.start()
+
+def _stop_log_listener():
+    """Остановка фонового потока с записью оставшихся сообщений."""
+    if _log_listener is not None:
+        _log_listener.stop()
+
+logging.basicConfig(level=logging.INFO, handlers=[_log_queue_handler], force=True)
+_start_log_listener()
+os.register_at_fork(after_in_child=_start_log_listener)
+atexit.register(_stop_log_listener)
 logger = logging.getLogger(__name__)
 
+class OrJSONProvider(JSONProvider):
+    """JSON-провайдер Flask на базе orjson (быстрее стандартного json, поддерживает numpy)."""
+
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.options).decode()
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
 # Создание Flask приложения
 basedir = os.path.abspath(os.path.dirname(__file__))
 app = Flask(__name__, static_folder=os.path.join(basedir, 'dist'))
+if orjson is not None:
+    app.json = OrJSONProvider(app)
+else:
+    logger.warning("orjson не установлен; используется стандартный JSON-сериализатор")
 CORS(
     app,
     resources={r"/*": {"origins": os.environ.get("ALLOWED_ORIGINS", "*")}},
 )
 
+# Кэш ответов для идемпотентных GET-эндпоинтов (в памяти процесса)
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 10})
+
+def _is_success_response(rv: Any) -> bool:
+    """Кэшируем только успешные ответы."""
+    status = rv[1] if isinstance(rv, tuple) and len(rv) > 1 else getattr(rv, "status_code", 200)
+    return status == 200
+
 # Глобальная переменная для модели
 fraud_model = None
 
+# Кэш текущей метки времени с точностью до секунды: (unix-время, ISO-строка)
+_timestamp_cache: Tuple[int, str] = (0, "")
+
+def now_iso() -> str:
+    """Текущее время в ISO-формате, пересчитывается не чаще раза в секунду."""
+    global _timestamp_cache
+    now = int(time.time())
+    cached_second, cached_iso = _timestamp_cache
+    if now != cached_second:
+        cached_iso = datetime.fromtimestamp(now).isoformat()
+        _timestamp_cache = (now, cached_iso)
+    return cached_iso
+
 def initialize_model():
     """Инициализация модели при запуске приложения."""
     global fraud_model
     try:
-        model_path = os.path.join(basedir, '..', 'model')
+        model_path = os.environ.get("MODEL_DIR") or os.path.join(basedir, '..', 'model')
         fraud_model = get_model(model_path)
         logger.info("Модель успешно инициализирована")
+        warmup_model()
         return True
     except Exception as e:
         logger.error(f"Ошибка инициализации модели: {e}")
         return False
 
-# Инициализация модели при запуске
-logger.info("Инициализация модели...")
-model_initialized = initialize_model()
-if not model_initialized:
-    logger.warning("Модель не инициализирована. API будет работать в ограниченном режиме.")
-    logger.warning("Убедитесь, что модель обучена и сохранена в папке model/")
+def warmup_model(rounds: int = 3, batch_size: int = 64):
+    """
+    Прогрев пути предсказания сразу после загрузки модели.
+    
+    Первые вызовы sklearn/BLAS выделяют память и инициализируют пулы потоков;
+    прогрев переносит эту задержку со старта первого запроса на загрузку приложения.
+    
+    Args:
+        rounds: Количество прогревочных прогонов
+        batch_size: Размер прогревочного пакета
+    """
+    started = time.perf_counter()
+    try:
+        sample = fraud_model.preprocessor.create_sample_transaction()
+        for _ in range(rounds):
+            fraud_model.predict_with_details(sample, 0.5)
+            fraud_model.batch_predict([sample] * batch_size, 0.5)
+        logger.info(f"Прогрев модели выполнен за {(time.perf_counter() - started) * 1000:.1f} мс")
+    except Exception as e:
+        logger.warning(f"Не удалось прогреть модель: {e}")
+
+# Инициализация модели при импорте модуля: при запуске через gunicorn --preload
+# модель загружается один раз в master-процессе и наследуется воркерами
+if fraud_model is None:
+    logger.info("Инициализация модели...")
+    model_initialized = initialize_model()
+    if not model_initialized:
+        logger.warning("Модель не инициализирована. API будет работать в ограниченном режиме.")
+        logger.warning("Убедитесь, что модель обучена и сохранена в папке model/")
+
+# Настройки объединения одиночных запросов /predict в пакеты
+PREDICT_BATCH_MAX = int(os.environ.get("PREDICT_BATCH_MAX", 64))
+PREDICT_BATCH_WAIT = float(os.environ.get("PREDICT_BATCH_WAIT_MS", 5)) / 1000
+PREDICT_TIMEOUT = float(os.environ.get("PREDICT_TIMEOUT", 30))
+
+# Настройки кэша результатов /predict
+PREDICT_CACHE_SIZE = int(os.environ.get("PREDICT_CACHE_SIZE", 1024))
+
+# Ограничения пакетного предсказания
+MAX_BATCH = int(os.environ.get("MAX_BATCH", 10000))
+BATCH_CHUNK = int(os.environ.get("BATCH_CHUNK", 512))
+MAX_BODY = int(os.environ.get("MAX_BODY", 8 * 1024 * 1024))  # байт в теле /predict/batch
+
+# Параллельная обработка больших пакетов: sklearn/numpy отпускают GIL в C-коде
+BATCH_POOL_WORKERS = int(os.environ.get("BATCH_POOL_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+BATCH_PARALLEL_MIN = int(os.environ.get("BATCH_PARALLEL_MIN", 256))
+
+# Запросы к LLM - ожидание сети, а не CPU: для них отдельный пул потоков
+LLM_POOL_WORKERS = int(os.environ.get("LLM_POOL_WORKERS", 8))
+
+# Максимальное количество сообщений в /chat/batch (каждое - отдельный запрос к LLM)
+MAX_CHAT_BATCH = int(os.environ.get("MAX_CHAT_BATCH", 10))
+
+# Языки объяснений и рекомендаций
+LANGUAGES = ('ru', 'en', 'kk')
+
+# Порядок признаков для ключа кэша
+FEATURE_ORDER = tuple(f"V{i}" for i in range(1, 29)) + ("Amount",)
+
+
+class BatchCoalescer:
+    """
+    Объединение конкурентных одиночных предсказаний в пакетные вызовы модели.
+
+    Запросы складываются в очередь, фоновый поток забирает до max_batch
+    элементов (или ждет не дольше max_wait секунд) и выполняет один вызов
+    batch_predict. Результат каждой транзакции возвращается через свой Future.
+    """
+
+    def __init__(self, max_batch: int = PREDICT_BATCH_MAX, max_wait: float = PREDICT_BATCH_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[Dict, float, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+
+    def _ensure_worker(self) -> None:
+        """Запуск фонового потока (в каждом процессе после fork gunicorn)."""
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name="predict-coalescer", daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def submit(self, transaction: Dict, threshold: float, timeout: float = PREDICT_TIMEOUT) -> Dict:
+        """Поставить транзакцию в очередь и дождаться результата."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((transaction, threshold, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self) -> List[Tuple[Dict, float, Future]]:
+        """Сбор пакета: до max_batch элементов или до истечения max_wait."""
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self) -> None:
+        while True:
+            items = self._collect()
+            try:
+                results = fraud_model.batch_predict(
+                    [transaction for transaction, _, _ in items],
+                    [threshold for _, threshold, _ in items]
+                )
+            except Exception as e:
+                logger.error(f"Ошибка пакетной обработки /predict: {e}")
+                for _, _, future in items:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, future), result in zip(items, results):
+                future.set_result(result)
+
+
+class PredictionCache:
+    """
+    Потокобезопасный LRU-кэш результатов предсказаний.
+
+    Ключ - кортеж округленных признаков транзакции и порог.
+    """
+
+    def __init__(self, maxsize: int = PREDICT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(transaction: Dict, threshold: float) -> Optional[tuple]:
+        """Построение ключа; None, если данные невалидны (их проверит модель)."""
+        try:
+            features = tuple(round(float(transaction[f]), 6) for f in FEATURE_ORDER)
+            time_value = round(float(transaction.get("Time", 0)), 6)
+        except (KeyError, ValueError, TypeError):
+            return None
+        return features + (time_value, threshold)
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        with self._lock:
+            result = self._data.get(key)
+            if result is not None:
+                self._data.move_to_end(key)
+            return result
+
+    def put(self, key: tuple, result: Dict) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = result
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+predict_coalescer = BatchCoalescer()
+prediction_cache = PredictionCache()
+
+
+class APIError(Exception):
+    """Ошибка запроса, которая отдается клиенту с заданным HTTP-кодом."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def api_handler(log_message: str, error_fields: Optional[Dict] = None,
+                server_error_prefix: str = "", server_error_timestamp: bool = False):
+    """
+    Декоратор эндпоинта с единой обработкой ошибок.
+
+    APIError и ошибки разбора входных данных (ValueError, TypeError, KeyError)
+    отдаются клиенту без traceback, остальные исключения логируются
+    с traceback и отдаются с кодом 500.
+
+    Args:
+        log_message: Префикс сообщения в логе при ошибке
+        error_fields: Дополнительные поля тела ответа с ошибкой
+        server_error_prefix: Префикс текста ошибки в ответе 500
+        server_error_timestamp: Добавлять ли timestamp в ответ 500
+    """
+    extra = error_fields or {}
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except APIError as e:
+                return jsonify({"error": e.message, **extra}), e.code
+            except (ValueError, TypeError, KeyError) as e:
+                # Некорректные входные данные: traceback не нужен
+                logger.warning("%s: %s", log_message, e)
+                return jsonify({"error": str(e), **extra}), 400
+            except Exception as e:
+                logger.exception("%s: %s", log_message, e)
+                body = {"error": f"{server_error_prefix}{e}", **extra}
+                if server_error_timestamp:
+                    body["timestamp"] = now_iso()
+                return jsonify(body), 500
+        return wrapper
+    return decorator
+
+
+def require_model() -> None:
+    """Проверка, что модель загружена (иначе 503)."""
+    if fraud_model is None:
+        raise APIError(503, "Модель не загружена")
+
+
+def get_json_payload(max_body: Optional[int] = None) -> Any:
+    """
+    Разбор JSON тела запроса.
+
+    Args:
+        max_body: Максимальный размер тела в байтах (проверяется до разбора)
+
+    Returns:
+        Any: Разобранное тело запроса
+    """
+    if not request.is_json:
+        raise APIError(400, "Ожидается JSON в теле запроса")
+    # Отклоняем слишком большое тело до разбора JSON
+    if max_body is not None and request.content_length is not None and request.content_length > max_body:
+        raise APIError(413, f"Максимальный размер тела запроса: {max_body} байт")
+    return request.get_json(cache=False)
+
+
+def parse_threshold(value: Any) -> float:
+    """
+    Валидация порога классификации.
+
+    Args:
+        value: Значение порога из запроса
+
+    Returns:
+        float: Порог в диапазоне [0, 1]
+    """
+    try:
+        threshold = float(value)
+    except (ValueError, TypeError):
+        raise APIError(400, "Порог должен быть числом")
+    if not 0 <= threshold <= 1:
+        raise APIError(400, "Порог должен быть между 0 и 1")
+    return threshold
+
+def _truncate_text(value: Any, limit: int) -> Any:
+    """Обрезка всех строк во вложенных словарях и списках до limit символов."""
+    if isinstance(value, str):
+        return value[:limit]
+    if isinstance(value, dict):
+        return {key: _truncate_text(item, limit) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_truncate_text(item, limit) for item in value]
+    return value
+
+
+def shape_response(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Сокращение тела ответа по параметрам запроса.
+
+    Query-параметры (оба необязательны):
+        fields: Список полей верхнего уровня через запятую, остальные отбрасываются
+        text_limit: Максимальная длина строк в ответе
+
+    Args:
+        body: Полное тело ответа
+
+    Returns:
+        Dict[str, Any]: Тело ответа только с запрошенными данными
+    """
+    fields = request.args.get("fields")
+    if fields:
+        body = {key: body[key] for key in fields.split(",") if key in body}
+    text_limit = request.args.get("text_limit")
+    if text_limit is not None:
+        try:
+            limit = int(text_limit)
+        except ValueError:
+            raise APIError(400, "Параметр 'text_limit' должен быть целым числом")
+        if limit < 0:
+            raise APIError(400, "Параметр 'text_limit' не может быть отрицательным")
+        body = _truncate_text(body, limit)
+    return body
 
 @app.route('/health', methods=['GET'])
+@cache.cached(timeout=5, response_filter=_is_success_response)
+@api_handler("Ошибка в health check", error_fields={"status": "error"}, server_error_timestamp=True)
 def health_check():
     """
     Проверка состояния API.
@@ -74,37 +441,30 @@ def health_check():
     Returns:
         JSON: Статус системы
     """
-    try:
-        # Проверяем состояние модели
-        model_status = fraud_model is not None
-        
-        # Получаем информацию о модели
-        model_info = {}
-        if fraud_model:
-            try:
-                model_info = fraud_model.get_model_info()
-            except Exception as e:
-                logger.warning(f"Не удалось получить информацию о модели: {e}")
-        
-        response = {
-            "status": "ok" if model_status else "error",
-            "timestamp": datetime.now().isoformat(),
-            "model_loaded": model_status,
-            "model_info": model_info,
-            "version": "1.0.0"
-        }
-        
-        return jsonify(response), 200
-        
-    except Exception as e:
-        logger.error(f"Ошибка в health check: {e}")
-        return jsonify({
-            "status": "error",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }), 500
+    # Проверяем состояние модели
+    model_status = fraud_model is not None
+    
+    # Получаем информацию о модели
+    model_info = {}
+    if fraud_model:
+        try:
+            model_info = fraud_model.get_model_info()
+        except Exception as e:
+            logger.warning(f"Не удалось получить информацию о модели: {e}")
+    
+    response = {
+        "status": "ok" if model_status else "error",
+        "timestamp": now_iso(),
+        "model_loaded": model_status,
+        "model_info": model_info,
+        "version": "1.0.0"
+    }
+    
+    return jsonify(response), 200, {"Cache-Control": "public, max-age=5"}
 
 @app.route('/predict', methods=['POST'])
+@api_handler("Ошибка в predict", error_fields={"fraud_score": None, "is_fraud": None},
+             server_error_prefix="Внутренняя ошибка сервера: ", server_error_timestamp=True)
 def predict_fraud():
     """
     Предсказание мошенничества для транзакции.
@@ -119,92 +479,50 @@ def predict_fraud():
     Returns:
         JSON: Результат предсказания
     """
-    try:
-        # Проверяем, что модель загружена
-        if fraud_model is None:
-            return jsonify({
-                "error": "Модель не загружена",
-                "fraud_score": None,
-                "is_fraud": None
-            }), 503
-        
-        # Получаем данные из запроса
-        if not request.is_json:
-            return jsonify({
-                "error": "Ожидается JSON в теле запроса",
-                "fraud_score": None,
-                "is_fraud": None
-            }), 400
-        
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "error": "Пустое тело запроса",
-                "fraud_score": None,
-                "is_fraud": None
-            }), 400
-        
-        # Получаем порог (по умолчанию 0.5)
-        threshold = data.pop('threshold', 0.5)
-        
-        # Валидируем порог
-        try:
-            threshold = float(threshold)
-            if not 0 <= threshold <= 1:
-                return jsonify({
-                    "error": "Порог должен быть между 0 и 1",
-                    "fraud_score": None,
-                    "is_fraud": None
-                }), 400
-        except (ValueError, TypeError):
-            return jsonify({
-                "error": "Порог должен быть числом",
-                "fraud_score": None,
-                "is_fraud": None
-            }), 400
-        
-        # Выполняем предсказание
-        result = validate_and_predict(data, threshold)
-        
-        # Проверяем результат валидации
-        if not result.get("valid", True):
-            return jsonify({
-                "error": result.get("error", "Ошибка валидации"),
-                "fraud_score": None,
-                "is_fraud": None
-            }), 400
-        
-        # Формируем ответ
-        response = {
-            "fraud_score": result.get("fraud_score"),
-            "is_fraud": result.get("is_fraud"),
-            "confidence": result.get("confidence"),
-            "risk_level": result.get("risk_level"),
-            "threshold": threshold,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        # Добавляем информацию о модели (опционально)
-        if "model_info" in result:
-            response["model_info"] = result["model_info"]
-        
-        logger.info(f"Предсказание выполнено: fraud_score={response['fraud_score']}, is_fraud={response['is_fraud']}")
-        
-        return jsonify(response), 200
-        
-    except Exception as e:
-        logger.error(f"Ошибка в predict: {e}")
-        logger.error(traceback.format_exc())
-        
-        return jsonify({
-            "error": f"Внутренняя ошибка сервера: {str(e)}",
-            "fraud_score": None,
-            "is_fraud": None,
-            "timestamp": datetime.now().isoformat()
-        }), 500
+    require_model()
+    data = get_json_payload()
+    if not data:
+        raise APIError(400, "Пустое тело запроса")
+    
+    # Получаем порог (по умолчанию 0.5)
+    threshold = parse_threshold(data.pop('threshold', 0.5))
+    
+    # Выполняем предсказание: повторные транзакции берем из кэша,
+    # остальные объединяются с конкурентными запросами в один пакет
+    cache_key = prediction_cache.make_key(data, threshold)
+    result = prediction_cache.get(cache_key) if cache_key is not None else None
+    if result is None:
+        result = predict_coalescer.submit(data, threshold)
+        if cache_key is not None and not result.get("error"):
+            prediction_cache.put(cache_key, result)
+    
+    # Проверяем результат валидации
+    if result.get("error"):
+        raise APIError(400, result.get("error", "Ошибка валидации"))
+    
+    # Формируем ответ
+    response = {
+        "fraud_score": result.get("fraud_score"),
+        "is_fraud": result.get("is_fraud"),
+        "confidence": result.get("confidence"),
+        "risk_level": result.get("risk_level"),
+        "threshold": threshold,
+        "timestamp": now_iso()
+    }
+    
+    # Добавляем информацию о модели (опционально)
+    if "model_info" in result:
+        response["model_info"] = result["model_info"]
+    
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Предсказание выполнено: fraud_score=%s, is_fraud=%s",
+                    response['fraud_score'], response['is_fraud'])
+    
+    return jsonify(response), 200
 
 @app.route('/model-info', methods=['GET'])
+@cache.cached(timeout=5, response_filter=_is_success_response)
+@api_handler("Ошибка получения информации о модели", server_error_timestamp=True)
 def get_model_info():
     """
     Получение информации о модели.
@@ -212,26 +530,19 @@ def get_model_info():
     Returns:
         JSON: Информация о модели
     """
-    try:
-        if fraud_model is None:
-            return jsonify({
-                "error": "Модель не загружена",
-                "model_loaded": False
-            }), 200
-        
-        info = fraud_model.get_model_info()
-        info["timestamp"] = datetime.now().isoformat()
-        
-        return jsonify(info), 200
-        
-    except Exception as e:
-        logger.error(f"Ошибка получения информации о модели: {e}")
+    if fraud_model is None:
         return jsonify({
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }), 500
+            "error": "Модель не загружена",
+            "model_loaded": False
+        }), 200
+    
+    info = fraud_model.get_model_info()
+    info["timestamp"] = now_iso()
+    
+    return jsonify(info), 200, {"Cache-Control": "public, max-age=5"}
 
 @app.route('/predict/batch', methods=['POST'])
+@api_handler("Ошибка в batch predict", server_error_timestamp=True)
 def predict_batch():
     """
     Пакетное предсказание для нескольких транзакций.
@@ -242,73 +553,124 @@ def predict_batch():
             {"V1": float, "V2": float, ..., "Amount": float},
             {"V1": float, "V2": float, ..., "Amount": float}
         ],
-        "threshold": float (optional, default 0.5)
+        "threshold": float (optional, default 0.5),
+        "stream": bool (optional, default false)
     }
     
+    При "stream": true или заголовке Accept: application/x-ndjson результаты
+    передаются построчно (NDJSON) частями по BATCH_CHUNK транзакций.
+    
     Returns:
         JSON: Список результатов предсказаний
     """
-    try:
-        if fraud_model is None:
-            return jsonify({
-                "error": "Модель не загружена"
-            }), 503
-        
-        if not request.is_json:
-            return jsonify({
-                "error": "Ожидается JSON в теле запроса"
-            }), 400
-        
-        data = request.get_json()
-        
-        if not data or "transactions" not in data:
-            return jsonify({
-                "error": "Ожидается поле 'transactions' с массивом транзакций"
-            }), 400
-        
-        transactions = data["transactions"]
-        threshold = data.get("threshold", 0.5)
-        
-        # Валидация порога
-        try:
-            threshold = float(threshold)
-            if not 0 <= threshold <= 1:
-                return jsonify({
-                    "error": "Порог должен быть между 0 и 1"
-                }), 400
-        except (ValueError, TypeError):
-            return jsonify({
-                "error": "Порог должен быть числом"
-            }), 400
-        
-        # Ограничение на количество транзакций
-        if len(transactions) > 100:
-            return jsonify({
-                "error": "Максимальное количество транзакций в пакете: 100"
-            }), 400
-        
-        # Выполняем пакетное предсказание
-        results = fraud_model.batch_predict(transactions, threshold)
-        
-        response = {
-            "results": results,
+    require_model()
+    data = get_json_payload(max_body=MAX_BODY)
+    if not data or "transactions" not in data:
+        raise APIError(400, "Ожидается поле 'transactions' с массивом транзакций")
+    
+    transactions = data["transactions"]
+    threshold = parse_threshold(data.get("threshold", 0.5))
+    
+    if not isinstance(transactions, list):
+        raise APIError(400, "Поле 'transactions' должно быть массивом")
+    
+    # Ограничение на количество транзакций
+    if len(transactions) > MAX_BATCH:
+        raise APIError(400, f"Максимальное количество транзакций в пакете: {MAX_BATCH}")
+    
+    if data.get("stream") or request.accept_mimetypes.best == "application/x-ndjson":
+        return _batch_ndjson_stream(transactions, threshold)
+    
+    # Выполняем пакетное предсказание
+    results = [result for chunk in _batch_predict_chunks(transactions, threshold) for result in chunk]
+    
+    response = {
+        "results": results,
+        "total_transactions": len(transactions),
+        "threshold": threshold,
+        "timestamp": now_iso()
+    }
+    
+    logger.info("Пакетное предсказание выполнено для %d транзакций", len(transactions))
+    
+    return jsonify(response), 200
+
+_batch_pool: Optional[ThreadPoolExecutor] = None
+_batch_pool_pid: Optional[int] = None
+_batch_pool_lock = threading.Lock()
+
+def _get_batch_pool() -> ThreadPoolExecutor:
+    """Пул потоков для пакетного предсказания (свой в каждом процессе после fork gunicorn)."""
+    global _batch_pool, _batch_pool_pid
+    pid = os.getpid()
+    if _batch_pool is None or _batch_pool_pid != pid:
+        with _batch_pool_lock:
+            if _batch_pool is None or _batch_pool_pid != pid:
+                _batch_pool = ThreadPoolExecutor(max_workers=BATCH_POOL_WORKERS, thread_name_prefix="fraud-batch")
+                _batch_pool_pid = pid
+    return _batch_pool
+
+_llm_pool: Optional[ThreadPoolExecutor] = None
+_llm_pool_pid: Optional[int] = None
+_llm_pool_lock = threading.Lock()
+
+def _get_llm_pool() -> ThreadPoolExecutor:
+    """Пул потоков для запросов к LLM (свой в каждом процессе после fork gunicorn)."""
+    global _llm_pool, _llm_pool_pid
+    pid = os.getpid()
+    if _llm_pool is None or _llm_pool_pid != pid:
+        with _llm_pool_lock:
+            if _llm_pool is None or _llm_pool_pid != pid:
+                _llm_pool = ThreadPoolExecutor(max_workers=LLM_POOL_WORKERS, thread_name_prefix="fraud-llm")
+                _llm_pool_pid = pid
+    return _llm_pool
+
+def _batch_predict_chunks(transactions: List[Dict], threshold: float) -> Iterator[List[Dict]]:
+    """
+    Пакетное предсказание частями со сквозной нумерацией.
+    
+    Пакеты от BATCH_PARALLEL_MIN транзакций делятся на равные части
+    (не больше BATCH_CHUNK) и обрабатываются параллельно в пуле потоков.
+    """
+    total = len(transactions)
+    chunk_size = BATCH_CHUNK
+    if total >= BATCH_PARALLEL_MIN and BATCH_POOL_WORKERS > 1:
+        chunk_size = min(BATCH_CHUNK, -(-total // BATCH_POOL_WORKERS))
+    offsets = range(0, total, chunk_size)
+    
+    def predict_chunk(offset: int) -> List[Dict]:
+        chunk = fraud_model.batch_predict(transactions[offset:offset + chunk_size], threshold)
+        for result in chunk:
+            result["transaction_id"] += offset
+        return chunk
+    
+    if len(offsets) > 1 and total >= BATCH_PARALLEL_MIN:
+        # map сохраняет порядок частей, результаты отдаются по мере готовности
+        yield from _get_batch_pool().map(predict_chunk, offsets)
+    else:
+        yield from map(predict_chunk, offsets)
+
+def _batch_ndjson_stream(transactions: List[Dict], threshold: float) -> Response:
+    """Потоковый ответ /predict/batch: одна строка JSON на каждую часть пакета."""
+    def generate() -> Iterator[str]:
+        for chunk in _batch_predict_chunks(transactions, threshold):
+            yield app.json.dumps({"chunk": chunk}) + "\n"
+        yield app.json.dumps({
+            "done": True,
             "total_transactions": len(transactions),
             "threshold": threshold,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        logger.info(f"Пакетное предсказание выполнено для {len(transactions)} транзакций")
-        
-        return jsonify(response), 200
-        
-    except Exception as e:
-        logger.error(f"Ошибка в batch predict: {e}")
-        return jsonify({
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }), 500
+            "timestamp": now_iso()
+        }) + "\n"
+        logger.info("Пакетное предсказание выполнено для %d транзакций", len(transactions))
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Препроцессор для генерации примера транзакции создается один раз
+sample_preprocessor = DataPreprocessor()
 
 @app.route('/sample-transaction', methods=['GET'])
+@cache.cached(timeout=300, response_filter=_is_success_response)
+@api_handler("Ошибка получения примера транзакции")
 def get_sample_transaction():
     """
     Получение примера транзакции для тестирования.
@@ -316,23 +678,16 @@ def get_sample_transaction():
     Returns:
         JSON: Пример транзакции
     """
-    try:
-        preprocessor = DataPreprocessor()
-        sample = preprocessor.create_sample_transaction()
-        
-        return jsonify({
-            "sample_transaction": sample,
-            "description": "Пример транзакции для тестирования API",
-            "usage": "Отправьте POST запрос на /predict с этими данными"
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Ошибка получения примера транзакции: {e}")
-        return jsonify({
-            "error": str(e)
-        }), 500
+    sample = sample_preprocessor.create_sample_transaction()
+    
+    return jsonify({
+        "sample_transaction": sample,
+        "description": "Пример транзакции для тестирования API",
+        "usage": "Отправьте POST запрос на /predict с этими данными"
+    }), 200, {"Cache-Control": "public, max-age=300"}
 
 @app.route('/explain', methods=['POST'])
+@api_handler("Ошибка в explain", server_error_prefix="Внутренняя ошибка сервера: ")
 def explain_fraud():
     """
     Объяснение предсказания мошенничества с помощью Gemini.
@@ -340,39 +695,55 @@ def explain_fraud():
     Expected JSON:
     {
       "transaction": { V1..V28, Amount, (optional) Time },
-      "threshold": float (optional, default 0.5)
+      "threshold": float (optional, default 0.5),
+      "stream": bool (optional, default false)
     }
+
+    При "stream": true или заголовке Accept: text/event-stream ответ
+    отдается как Server-Sent Events: событие "result" с предсказанием,
+    затем фрагменты объяснения {"delta": str} и событие "done".
     """
-    try:
-        if fraud_model is None:
-            return jsonify({"error": "Модель не загружена"}), 503
+    require_model()
+    payload = get_json_payload() or {}
+    # Поддерживаем два формата: либо транзакция на верхнем уровне, либо в поле transaction
+    transaction = payload.get("transaction") if isinstance(payload, dict) else None
+    if transaction is None:
+        transaction = payload
 
-        if not request.is_json:
-            return jsonify({"error": "Ожидается JSON в теле запроса"}), 400
+    threshold = parse_threshold(payload.get("threshold", 0.5))
 
-        payload = request.get_json() or {}
-        # Поддерживаем два формата: либо транзакция на верхнем уровне, либо в поле transaction
-        transaction = payload.get("transaction") if isinstance(payload, dict) else None
-        if transaction is None:
-            transaction = payload
+    # Получаем детальный результат предсказания
+    result = fraud_model.predict_with_details(transaction, threshold)
+    if result.get("error"):
+        raise APIError(400, result["error"])
 
-        threshold = payload.get("threshold", 0.5)
-        try:
-            threshold = float(threshold)
-            if not 0 <= threshold <= 1:
-                return jsonify({"error": "Порог должен быть между 0 и 1"}), 400
-        except (ValueError, TypeError):
-            return jsonify({"error": "Порог должен быть числом"}), 400
-
-        # Получаем детальный результат предсказания
-        result = fraud_model.predict_with_details(transaction, threshold)
-        if result.get("error"):
-            return jsonify({"error": result["error"]}), 400
-
-        # Генерируем объяснение через LLM
-        explanation = explain_transaction(transaction, result)
-        response = {
-            "explanation": explanation,
+    if payload.get("stream") or request.accept_mimetypes.best == "text/event-stream":
+        return _explain_event_stream(transaction, result, threshold)
+
+    # Генерируем объяснение через LLM
+    explanation = explain_transaction(transaction, result)
+    response = {
+        "explanation": explanation,
+        "fraud_score": result.get("fraud_score"),
+        "is_fraud": result.get("is_fraud"),
+        "confidence": result.get("confidence"),
+        "risk_level": result.get("risk_level"),
+        "threshold": result.get("threshold", threshold),
+        "model_info": result.get("model_info", {}),
+        "llm_enabled": llm_available(),
+        "timestamp": now_iso(),
+    }
+    return jsonify(response), 200
+
+def _sse_event(data: Any, event: Optional[str] = None) -> str:
+    """Форматирование одного события Server-Sent Events."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {app.json.dumps(data)}\n\n"
+
+def _explain_event_stream(transaction: Dict, result: Dict, threshold: float) -> Response:
+    """Потоковый ответ /explain: объяснение передается по мере генерации."""
+    def generate() -> Iterator[str]:
+        yield _sse_event({
             "fraud_score": result.get("fraud_score"),
             "is_fraud": result.get("is_fraud"),
             "confidence": result.get("confidence"),
@@ -380,16 +751,20 @@ def explain_fraud():
             "threshold": result.get("threshold", threshold),
             "model_info": result.get("model_info", {}),
             "llm_enabled": llm_available(),
-            "timestamp": datetime.now().isoformat(),
-        }
-        return jsonify(response), 200
+            "timestamp": now_iso(),
+        }, event="result")
+        for chunk in explain_transaction_stream(transaction, result):
+            yield _sse_event({"delta": chunk})
+        yield _sse_event({"timestamp": now_iso()}, event="done")
 
-    except Exception as e:
-        logger.error(f"Ошибка в explain: {e}")
-        logger.error(traceback.format_exc())
-        return jsonify({"error": f"Внутренняя ошибка сервера: {str(e)}"}), 500
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route('/explain/enhanced', methods=['POST'])
+@api_handler("Ошибка в enhanced_explain", server_error_prefix="Внутренняя ошибка сервера: ")
 def enhanced_explain():
     """
     Расширенное объяснение с похожими случаями и рекомендациями.
@@ -401,59 +776,117 @@ def enhanced_explain():
         "language": str (optional, default 'ru')
     }
     """
-    try:
-        if fraud_model is None:
-            return jsonify({"error": "Модель не загружена"}), 503
-
-        if not request.is_json:
-            return jsonify({"error": "Ожидается JSON в теле запроса"}), 400
-
-        payload = request.get_json() or {}
-        transaction = payload.get("transaction", payload)
-        threshold = float(payload.get("threshold", 0.5))
-        language = payload.get("language", "ru")
-        
-        if language not in ['ru', 'en', 'kk']:
-            return jsonify({"error": "Поддерживаемые языки: ru, en, kk"}), 400
-
-        # Получаем детальный результат предсказания
-        result = fraud_model.predict_with_details(transaction, threshold)
-        if result.get("error"):
-            return jsonify({"error": result["error"]}), 400
-
-        # Генерируем расширенное объяснение
-        explanation = get_enhanced_explanation(transaction, result, language)
-        
-        # Находим похожие случаи
-        similar_cases = find_similar_transactions(transaction, top_k=3)
-        
-        # Анализируем аномалии
-        anomalies = analyze_transaction_anomalies(transaction, result)
-        
-        # Получаем рекомендации
-        recommendations = get_risk_recommendations(transaction, result, language)
-
-        response = {
-            "explanation": explanation,
-            "similar_cases": similar_cases,
-            "anomalies": anomalies,
-            "recommendations": recommendations,
-            "fraud_score": result.get("fraud_score"),
-            "is_fraud": result.get("is_fraud"),
-            "confidence": result.get("confidence"),
-            "risk_level": result.get("risk_level"),
-            "threshold": threshold,
-            "language": language,
-            "timestamp": datetime.now().isoformat()
+    require_model()
+    payload = get_json_payload() or {}
+    transaction = payload.get("transaction", payload)
+    threshold = float(payload.get("threshold", 0.5))
+    language = payload.get("language", "ru")
+    
+    if language not in ['ru', 'en', 'kk']:
+        raise APIError(400, "Поддерживаемые языки: ru, en, kk")
+
+    # Получаем детальный результат предсказания
+    result = fraud_model.predict_with_details(transaction, threshold)
+    if result.get("error"):
+        raise APIError(400, result["error"])
+
+    # Генерируем расширенное объяснение
+    explanation = get_enhanced_explanation(transaction, result, language)
+    
+    # Находим похожие случаи
+    similar_cases = find_similar_transactions(transaction, top_k=3)
+    
+    # Анализируем аномалии
+    anomalies = analyze_transaction_anomalies(transaction, result)
+    
+    # Получаем рекомендации
+    recommendations = get_risk_recommendations(transaction, result, language)
+
+    response = {
+        "explanation": explanation,
+        "similar_cases": similar_cases,
+        "anomalies": anomalies,
+        "recommendations": recommendations,
+        "fraud_score": result.get("fraud_score"),
+        "is_fraud": result.get("is_fraud"),
+        "confidence": result.get("confidence"),
+        "risk_level": result.get("risk_level"),
+        "threshold": threshold,
+        "language": language,
+        "timestamp": now_iso()
+    }
+    
+    return jsonify(shape_response(response)), 200
+
+def _parse_languages(payload: Dict[str, Any]) -> List[str]:
+    """Список языков из поля 'languages' (без повторов, в порядке запроса)."""
+    languages = payload.get("languages", list(LANGUAGES))
+    if not isinstance(languages, list) or not languages:
+        raise APIError(400, "Поле 'languages' должно быть непустым списком")
+    if any(language not in LANGUAGES for language in languages):
+        raise APIError(400, "Поддерживаемые языки: ru, en, kk")
+    return list(dict.fromkeys(languages))
+
+def _predict_for_payload(payload: Dict[str, Any]) -> Tuple[Dict, float, Dict]:
+    """Транзакция, порог и детальный результат предсказания из тела запроса."""
+    transaction = payload.get("transaction", {})
+    threshold = parse_threshold(payload.get("threshold", 0.5))
+    
+    if not transaction:
+        raise APIError(400, "Поле 'transaction' обязательно")
+
+    result = fraud_model.predict_with_details(transaction, threshold)
+    if result.get("error"):
+        raise APIError(400, result["error"])
+    return transaction, threshold, result
+
+@app.route('/explain/enhanced/batch', methods=['POST'])
+@api_handler("Ошибка в enhanced_explain_batch", server_error_prefix="Внутренняя ошибка сервера: ")
+def enhanced_explain_batch():
+    """
+    Расширенное объяснение одной транзакции сразу на нескольких языках.
+    
+    Предсказание, похожие случаи и аномалии не зависят от языка и
+    считаются один раз; объяснения для языков генерируются параллельно.
+    
+    Expected JSON:
+    {
+        "transaction": { V1..V28, Amount },
+        "threshold": float (optional, default 0.5),
+        "languages": [str] (optional, default ['ru', 'en', 'kk'])
+    }
+    """
+    require_model()
+    payload = get_json_payload() or {}
+    languages = _parse_languages(payload)
+    transaction, threshold, result = _predict_for_payload(payload)
+
+    def explain(language: str) -> Dict[str, Any]:
+        return {
+            "explanation": get_enhanced_explanation(transaction, result, language),
+            "recommendations": get_risk_recommendations(transaction, result, language),
+            "language": language
         }
-        
-        return jsonify(response), 200
 
-    except Exception as e:
-        logger.error(f"Ошибка в enhanced_explain: {e}")
-        return jsonify({"error": f"Внутренняя ошибка сервера: {str(e)}"}), 500
+    per_language = _get_llm_pool().map(explain, languages)
+
+    response = {
+        "per_language": {item["language"]: item for item in per_language},
+        "similar_cases": find_similar_transactions(transaction, top_k=3),
+        "anomalies": analyze_transaction_anomalies(transaction, result),
+        "fraud_score": result.get("fraud_score"),
+        "is_fraud": result.get("is_fraud"),
+        "confidence": result.get("confidence"),
+        "risk_level": result.get("risk_level"),
+        "threshold": threshold,
+        "languages": languages,
+        "timestamp": now_iso()
+    }
+    
+    return jsonify(shape_response(response)), 200
 
 @app.route('/similar-cases', methods=['POST'])
+@api_handler("Ошибка в get_similar_cases")
 def get_similar_cases():
     """
     Поиск похожих исторических случаев.
@@ -464,30 +897,23 @@ def get_similar_cases():
         "top_k": int (optional, default 5)
     }
     """
-    try:
-        if not request.is_json:
-            return jsonify({"error": "Ожидается JSON в теле запроса"}), 400
-
-        payload = request.get_json()
-        transaction = payload.get("transaction", {})
-        top_k = int(payload.get("top_k", 5))
-        
-        if not transaction:
-            return jsonify({"error": "Поле 'transaction' обязательно"}), 400
-
-        similar_cases = find_similar_transactions(transaction, top_k)
-        
-        return jsonify({
-            "similar_cases": similar_cases,
-            "total_found": len(similar_cases),
-            "timestamp": datetime.now().isoformat()
-        }), 200
+    payload = get_json_payload()
+    transaction = payload.get("transaction", {})
+    top_k = int(payload.get("top_k", 5))
+    
+    if not transaction:
+        raise APIError(400, "Поле 'transaction' обязательно")
 
-    except Exception as e:
-        logger.error(f"Ошибка в get_similar_cases: {e}")
-        return jsonify({"error": str(e)}), 500
+    similar_cases = find_similar_transactions(transaction, top_k)
+    
+    return jsonify({
+        "similar_cases": similar_cases,
+        "total_found": len(similar_cases),
+        "timestamp": now_iso()
+    }), 200
 
 @app.route('/analyze-anomalies', methods=['POST'])
+@api_handler("Ошибка в analyze_anomalies")
 def analyze_anomalies():
     """
     Детальный анализ аномалий в транзакции.
@@ -498,40 +924,31 @@ def analyze_anomalies():
         "threshold": float (optional, default 0.5)
     }
     """
-    try:
-        if fraud_model is None:
-            return jsonify({"error": "Модель не загружена"}), 503
-
-        if not request.is_json:
-            return jsonify({"error": "Ожидается JSON в теле запроса"}), 400
-
-        payload = request.get_json()
-        transaction = payload.get("transaction", {})
-        threshold = float(payload.get("threshold", 0.5))
-        
-        if not transaction:
-            return jsonify({"error": "Поле 'transaction' обязательно"}), 400
-
-        # Получаем результат предсказания
-        result = fraud_model.predict_with_details(transaction, threshold)
-        if result.get("error"):
-            return jsonify({"error": result["error"]}), 400
-
-        # Анализируем аномалии
-        anomalies = analyze_transaction_anomalies(transaction, result)
-        
-        return jsonify({
-            "anomalies": anomalies,
-            "fraud_score": result.get("fraud_score"),
-            "is_fraud": result.get("is_fraud"),
-            "timestamp": datetime.now().isoformat()
-        }), 200
+    require_model()
+    payload = get_json_payload()
+    transaction = payload.get("transaction", {})
+    threshold = float(payload.get("threshold", 0.5))
+    
+    if not transaction:
+        raise APIError(400, "Поле 'transaction' обязательно")
 
-    except Exception as e:
-        logger.error(f"Ошибка в analyze_anomalies: {e}")
-        return jsonify({"error": str(e)}), 500
+    # Получаем результат предсказания
+    result = fraud_model.predict_with_details(transaction, threshold)
+    if result.get("error"):
+        raise APIError(400, result["error"])
+
+    # Анализируем аномалии
+    anomalies = analyze_transaction_anomalies(transaction, result)
+    
+    return jsonify({
+        "anomalies": anomalies,
+        "fraud_score": result.get("fraud_score"),
+        "is_fraud": result.get("is_fraud"),
+        "timestamp": now_iso()
+    }), 200
 
 @app.route('/recommendations', methods=['POST'])
+@api_handler("Ошибка в get_recommendations")
 def get_recommendations():
     """
     Получение рекомендаций по снижению рисков.
@@ -543,43 +960,67 @@ def get_recommendations():
         "language": str (optional, default 'ru')
     }
     """
-    try:
-        if fraud_model is None:
-            return jsonify({"error": "Модель не загружена"}), 503
-
-        if not request.is_json:
-            return jsonify({"error": "Ожидается JSON в теле запроса"}), 400
-
-        payload = request.get_json()
-        transaction = payload.get("transaction", {})
-        threshold = float(payload.get("threshold", 0.5))
-        language = payload.get("language", "ru")
-        
-        if not transaction:
-            return jsonify({"error": "Поле 'transaction' обязательно"}), 400
-
-        # Получаем результат предсказания
-        result = fraud_model.predict_with_details(transaction, threshold)
-        if result.get("error"):
-            return jsonify({"error": result["error"]}), 400
-
-        # Получаем рекомендации
-        recommendations = get_risk_recommendations(transaction, result, language)
-        
-        return jsonify({
-            "recommendations": recommendations,
-            "fraud_score": result.get("fraud_score"),
-            "is_fraud": result.get("is_fraud"),
-            "risk_level": result.get("risk_level"),
-            "language": language,
-            "timestamp": datetime.now().isoformat()
-        }), 200
+    require_model()
+    payload = get_json_payload()
+    transaction = payload.get("transaction", {})
+    threshold = float(payload.get("threshold", 0.5))
+    language = payload.get("language", "ru")
+    
+    if not transaction:
+        raise APIError(400, "Поле 'transaction' обязательно")
 
-    except Exception as e:
-        logger.error(f"Ошибка в get_recommendations: {e}")
-        return jsonify({"error": str(e)}), 500
+    # Получаем результат предсказания
+    result = fraud_model.predict_with_details(transaction, threshold)
+    if result.get("error"):
+        raise APIError(400, result["error"])
+
+    # Получаем рекомендации
+    recommendations = get_risk_recommendations(transaction, result, language)
+    
+    return jsonify({
+        "recommendations": recommendations,
+        "fraud_score": result.get("fraud_score"),
+        "is_fraud": result.get("is_fraud"),
+        "risk_level": result.get("risk_level"),
+        "language": language,
+        "timestamp": now_iso()
+    }), 200
+
+@app.route('/recommendations/batch', methods=['POST'])
+@api_handler("Ошибка в get_recommendations_batch")
+def get_recommendations_batch():
+    """
+    Рекомендации по снижению рисков сразу на нескольких языках.
+    
+    Expected JSON:
+    {
+        "transaction": { V1..V28, Amount },
+        "threshold": float (optional, default 0.5),
+        "languages": [str] (optional, default ['ru', 'en', 'kk'])
+    }
+    """
+    require_model()
+    payload = get_json_payload() or {}
+    languages = _parse_languages(payload)
+    transaction, threshold, result = _predict_for_payload(payload)
+
+    return jsonify({
+        "per_language": {
+            language: {
+                "recommendations": get_risk_recommendations(transaction, result, language),
+                "language": language
+            }
+            for language in languages
+        },
+        "fraud_score": result.get("fraud_score"),
+        "is_fraud": result.get("is_fraud"),
+        "risk_level": result.get("risk_level"),
+        "languages": languages,
+        "timestamp": now_iso()
+    }), 200
 
 @app.route('/feedback', methods=['POST'])
+@api_handler("Ошибка в submit_feedback")
 def submit_feedback():
     """
     Отправка обратной связи по предсказанию.
@@ -591,32 +1032,25 @@ def submit_feedback():
         "feedback": bool (true - правильно, false - неправильно)
     }
     """
-    try:
-        if not request.is_json:
-            return jsonify({"error": "Ожидается JSON в теле запроса"}), 400
-
-        payload = request.get_json()
-        transaction = payload.get("transaction", {})
-        prediction_result = payload.get("prediction_result", {})
-        feedback = payload.get("feedback")
-        
-        if not transaction or not prediction_result or feedback is None:
-            return jsonify({"error": "Все поля обязательны: transaction, prediction_result, feedback"}), 400
-
-        # Сохраняем обратную связь
-        save_transaction_feedback(transaction, prediction_result, bool(feedback))
-        
-        return jsonify({
-            "message": "Обратная связь сохранена",
-            "feedback": feedback,
-            "timestamp": datetime.now().isoformat()
-        }), 200
+    payload = get_json_payload()
+    transaction = payload.get("transaction", {})
+    prediction_result = payload.get("prediction_result", {})
+    feedback = payload.get("feedback")
+    
+    if not transaction or not prediction_result or feedback is None:
+        raise APIError(400, "Все поля обязательны: transaction, prediction_result, feedback")
 
-    except Exception as e:
-        logger.error(f"Ошибка в submit_feedback: {e}")
-        return jsonify({"error": str(e)}), 500
+    # Сохраняем обратную связь
+    save_transaction_feedback(transaction, prediction_result, bool(feedback))
+    
+    return jsonify({
+        "message": "Обратная связь сохранена",
+        "feedback": feedback,
+        "timestamp": now_iso()
+    }), 200
 
 @app.route('/chat', methods=['POST'])
+@api_handler("Ошибка в chat_endpoint")
 def chat_endpoint():
     """
     Чат-бот для вопросов о транзакциях.
@@ -629,50 +1063,77 @@ def chat_endpoint():
         "transaction_context": dict (optional)
     }
     """
-    try:
-        if not request.is_json:
-            return jsonify({"error": "Ожидается JSON в теле запроса"}), 400
-
-        payload = request.get_json()
-        message = payload.get("message", "")
-        session_id = payload.get("session_id", "")
-        language = payload.get("language", "ru")
-        transaction_context = payload.get("transaction_context")
-        
-        if not message or not session_id:
-            return jsonify({"error": "Поля 'message' и 'session_id' обязательны"}), 400
-
-        if language not in ['ru', 'en', 'kk']:
-            return jsonify({"error": "Поддерживаемые языки: ru, en, kk"}), 400
-
-        # Обрабатываем сообщение через чат-бот
-        response = chat_with_bot(session_id, message, language, transaction_context)
-        
-        return jsonify(response), 200
+    payload = get_json_payload()
+    message = payload.get("message", "")
+    session_id = payload.get("session_id", "")
+    language = payload.get("language", "ru")
+    transaction_context = payload.get("transaction_context")
+    
+    if not message or not session_id:
+        raise APIError(400, "Поля 'message' и 'session_id' обязательны")
 
-    except Exception as e:
-        logger.error(f"Ошибка в chat_endpoint: {e}")
-        return jsonify({"error": str(e)}), 500
+    if language not in ['ru', 'en', 'kk']:
+        raise APIError(400, "Поддерживаемые языки: ru, en, kk")
+
+    # Обрабатываем сообщение через чат-бот
+    response = chat_with_bot(session_id, message, language, transaction_context)
+    
+    return jsonify(shape_response(response)), 200
+
+@app.route('/chat/batch', methods=['POST'])
+@api_handler("Ошибка в chat_batch_endpoint")
+def chat_batch_endpoint():
+    """
+    Несколько сообщений чат-боту одним запросом.
+    
+    Сообщения обрабатываются по порядку в одной сессии; язык каждого
+    сообщения становится языком сессии для ответа на него.
+    Не более MAX_CHAT_BATCH сообщений.
+    
+    Expected JSON:
+    {
+        "session_id": str,
+        "messages": [
+            {
+                "message": str,
+                "language": str (optional, default 'ru'),
+                "transaction_context": dict (optional)
+            }
+        ]
+    }
+    """
+    payload = get_json_payload()
+    session_id = payload.get("session_id", "")
+    messages = payload.get("messages")
+    
+    if not session_id or not isinstance(messages, list) or not messages:
+        raise APIError(400, "Поля 'session_id' и 'messages' (непустой список) обязательны")
+    if len(messages) > MAX_CHAT_BATCH:
+        raise APIError(400, f"Максимальное количество сообщений в пакете: {MAX_CHAT_BATCH}")
+
+    for item in messages:
+        if not isinstance(item, dict) or not item.get("message"):
+            raise APIError(400, "Каждое сообщение должно содержать поле 'message'")
+        if item.get("language", "ru") not in LANGUAGES:
+            raise APIError(400, "Поддерживаемые языки: ru, en, kk")
+
+    response = chat_batch_with_bot(session_id, messages)
+    
+    return jsonify(shape_response(response)), 200
 
 @app.route('/chat/stats', methods=['GET'])
+@api_handler("Ошибка в chat_stats")
 def chat_stats():
     """Статистика чат-бота."""
-    try:
-        stats = get_chatbot_stats()
-        return jsonify(stats), 200
-    except Exception as e:
-        logger.error(f"Ошибка в chat_stats: {e}")
-        return jsonify({"error": str(e)}), 500
+    stats = get_chatbot_stats()
+    return jsonify(stats), 200
 
 @app.route('/chat/clear/<session_id>', methods=['DELETE'])
+@api_handler("Ошибка в clear_chat_session")
 def clear_chat_session(session_id):
     """Очистка сессии чат-бота."""
-    try:
-        clear_chatbot_session(session_id)
-        return jsonify({"message": f"Сессия {session_id} очищена"}), 200
-    except Exception as e:
-        logger.error(f"Ошибка в clear_chat_session: {e}")
-        return jsonify({"error": str(e)}), 500
+    clear_chatbot_session(session_id)
+    return jsonify({"message": f"Сессия {session_id} очищена"}), 200
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -702,17 +1163,20 @@ def internal_error(error):
     logger.error(f"Внутренняя ошибка сервера: {error}")
     return jsonify({
         "error": "Внутренняя ошибка сервера",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now_iso()
     }), 500
 
 
 
 if __name__ == '__main__':
-    # Запуск сервера
+    # Встроенный сервер Flask обрабатывает запросы последовательно и подходит
+    # только для локальной разработки. В production используйте gunicorn:
+    #   gunicorn -c gunicorn.conf.py app.wsgi:app
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('DEBUG', 'False').lower() == 'true'
     
-    logger.info(f"Сервер запускается на порту {port}")
+    logger.info(f"Сервер разработки запускается на порту {port}")
+    logger.info("Для production используйте: gunicorn -c gunicorn.conf.py app.wsgi:app")
     logger.info("Доступные эндпоинты:")
     logger.info("  GET  /health - проверка состояния")
     logger.info("  POST /predict - предсказание мошенничества")
@@ -721,9 +1185,11 @@ if __name__ == '__main__':
     logger.info("  GET  /sample-transaction - пример транзакции")
     logger.info("  POST /explain - базовое объяснение")
     logger.info("  POST /explain/enhanced - расширенное объяснение с многоязычностью")
+    logger.info("  POST /explain/enhanced/batch - расширенное объяснение на нескольких языках")
     logger.info("  POST /similar-cases - поиск похожих случаев")
     logger.info("  POST /analyze-anomalies - анализ аномалий")
     logger.info("  POST /recommendations - рекомендации по рискам")
+    logger.info("  POST /recommendations/batch - рекомендации на нескольких языках")
     logger.info("  POST /feedback - обратная связь")
     logger.info("  POST /chat - чат-бот")
     logger.info("  GET  /chat/stats - статистика чат-бота")
@@ -9,14 +9,27 @@ Conversational AI чат-бот для вопросов о транзакция
 """
 
 import os
+import re
 import json
+import heapq
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from collections import Counter, deque
+from itertools import islice
+from types import MappingProxyType
+from typing import Deque, Dict, Any, List, Mapping, NamedTuple, Optional, Tuple
 from datetime import datetime
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+# Время жизни неактивной сессии чата (секунды)
+SESSION_TTL = int(os.environ.get("CHATBOT_SESSION_TTL", 3600))
+
+# Сколько последних сообщений разговора отправляется в модель
+CHAT_HISTORY_WINDOW = 10
+
 try:
     import google.generativeai as genai
 except Exception as e:
@@ -29,28 +42,54 @@ class ChatbotMode(Enum):
     SECURITY_ADVICE = "security"  # Советы по безопасности
     SYSTEM_HELP = "help"  # Помощь по системе
 
+# Ключевые слова для определения режима (в порядке приоритета)
+INTENT_KEYWORDS = [
+    (ChatbotMode.TRANSACTION_ANALYSIS, ['транзакция', 'платеж', 'перевод', 'transaction', 'payment', 'transfer']),
+    (ChatbotMode.SECURITY_ADVICE, ['безопасность', 'защита', 'мошенник', 'security', 'fraud', 'scam']),
+    (ChatbotMode.SYSTEM_HELP, ['помощь', 'как работает', 'что умеет', 'help', 'how', 'what can']),
+]
+
+# Одно скомпилированное регулярное выражение на режим вместо поиска по каждому слову
+INTENT_PATTERNS = [
+    (mode, re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE))
+    for mode, keywords in INTENT_KEYWORDS
+]
+
+class KnowledgeBase(NamedTuple):
+    """Неизменяемая база знаний чат-бота для одного языка."""
+    greeting: str
+    transaction_help: str
+    security_tips: Tuple[str, ...]
+    system_features: Tuple[str, ...]
+    security_tips_block: str
+    system_features_block: str
+
 class ConversationContext:
     """Контекст разговора для поддержания истории."""
     
     def __init__(self, session_id: str, language: str = 'ru'):
         self.session_id = session_id
         self.language = language
-        self.history: List[Dict[str, str]] = []
+        # Храним только последние 20 сообщений
+        self.history: Deque[Dict[str, str]] = deque(maxlen=20)
         self.current_transaction: Optional[Dict[str, Any]] = None
         self.mode = ChatbotMode.GENERAL
         self.created_at = datetime.now()
+        self.last_activity = time.monotonic()
+        # Срок действия, под которым сессия записана в куче истечения
+        self.expires_at = 0.0
+        # Сессия Gemini с накопленной историей и ключ контекста, для которого она создана
+        self.chat_session = None
+        self.chat_session_key = None
     
     def add_message(self, role: str, content: str):
         """Добавление сообщения в историю."""
+        self.last_activity = time.monotonic()
         self.history.append({
             "role": role,
             "content": content,
             "timestamp": datetime.now().isoformat()
         })
-        
-        # Ограничиваем историю последними 20 сообщениями
-        if len(self.history) > 20:
-            self.history = self.history[-20:]
     
     def set_transaction_context(self, transaction: Dict[str, Any], result: Dict[str, Any]):
         """Установка контекста транзакции."""
@@ -75,6 +114,13 @@ class FraudChatbot:
     def __init__(self):
         self.model = None
         self.sessions: Dict[str, ConversationContext] = {}
+        # Куча (срок действия, session_id) для удаления неактивных сессий и счетчики для статистики
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._language_counts: Counter = Counter()
+        self._mode_counts: Counter = Counter()
+        self._lock = threading.Lock()
+        # Неизменяемые части системного промпта по (язык, режим)
+        self._prompt_cache: Dict[Tuple[str, ChatbotMode], Tuple[str, str]] = {}
         self._init_model()
         self._load_knowledge_base()
     
@@ -95,7 +141,7 @@ class FraudChatbot:
     
     def _load_knowledge_base(self):
         """Загрузка базы знаний для чат-бота."""
-        self.knowledge_base = {
+        raw_knowledge_base = {
             'ru': {
                 'greeting': "Привет! Я AI-ассистент по детекции мошенничества. Могу помочь с анализом транзакций, объяснить работу системы или дать советы по безопасности.",
                 'transaction_help': "Для анализа транзакции предоставьте данные в формате JSON с полями V1-V28 и Amount.",
@@ -145,16 +191,37 @@ class FraudChatbot:
                 ]
             }
         }
+        
+        # Замораживаем базу знаний; списки для промпта собираем в строки один раз
+        self.knowledge_base: Mapping[str, KnowledgeBase] = MappingProxyType({
+            lang: KnowledgeBase(
+                greeting=kb['greeting'],
+                transaction_help=kb['transaction_help'],
+                security_tips=tuple(kb['security_tips']),
+                system_features=tuple(kb['system_features']),
+                security_tips_block='\n'.join('- ' + tip for tip in kb['security_tips']),
+                system_features_block='\n'.join('- ' + feature for feature in kb['system_features'])
+            )
+            for lang, kb in raw_knowledge_base.items()
+        })
     
     def create_session(self, session_id: str, language: str = 'ru') -> ConversationContext:
         """Создание новой сессии чата."""
         context = ConversationContext(session_id, language)
-        self.sessions[session_id] = context
         
         # Приветственное сообщение
-        greeting = self.knowledge_base[language]['greeting']
+        greeting = self.knowledge_base[language].greeting
         context.add_message("assistant", greeting)
         
+        with self._lock:
+            self._evict_expired()
+            self._remove_session(session_id)
+            self.sessions[session_id] = context
+            self._language_counts[context.language] += 1
+            self._mode_counts[context.mode] += 1
+            context.expires_at = context.last_activity + SESSION_TTL
+            heapq.heappush(self._expiry_heap, (context.expires_at, session_id))
+        
         logger.info(f"Создана новая сессия чата: {session_id}")
         return context
     
@@ -162,9 +229,56 @@ class FraudChatbot:
         """Получение существующей сессии."""
         return self.sessions.get(session_id)
     
+    def _remove_session(self, session_id: str) -> Optional[ConversationContext]:
+        """Удаление сессии и обновление счетчиков (вызывается под self._lock)."""
+        context = self.sessions.pop(session_id, None)
+        if context is not None:
+            self._language_counts[context.language] -= 1
+            self._mode_counts[context.mode] -= 1
+        return context
+    
+    def _evict_expired(self):
+        """Удаление неактивных сессий с вершины кучи (вызывается под self._lock)."""
+        now = time.monotonic()
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, session_id = heapq.heappop(heap)
+            context = self.sessions.get(session_id)
+            if context is None or context.expires_at != expires_at:
+                # Запись устарела: сессия удалена или пересоздана
+                continue
+            if context.last_activity + SESSION_TTL > now:
+                # Сессия была активна - продлеваем срок действия
+                context.expires_at = context.last_activity + SESSION_TTL
+                heapq.heappush(heap, (context.expires_at, session_id))
+                continue
+            self._remove_session(session_id)
+            logger.info(f"Сессия {session_id} удалена по истечении времени неактивности")
+    
+    def _track_mode_change(self, previous_mode: ChatbotMode, context: ConversationContext):
+        """Обновление счетчика режимов после обработки сообщения."""
+        if previous_mode == context.mode:
+            return
+        with self._lock:
+            if self.sessions.get(context.session_id) is context:
+                self._mode_counts[previous_mode] -= 1
+                self._mode_counts[context.mode] += 1
+    
+    def _set_language(self, context: ConversationContext, language: str):
+        """Смена языка сессии с обновлением счетчика языков."""
+        with self._lock:
+            if self.sessions.get(context.session_id) is context:
+                self._language_counts[context.language] -= 1
+                self._language_counts[language] += 1
+            context.language = language
+    
     def process_message(self, session_id: str, message: str, 
-                       transaction_context: Optional[Dict[str, Any]] = None) -> str:
-        """Обработка сообщения пользователя."""
+                       transaction_context: Optional[Dict[str, Any]] = None,
+                       language: Optional[str] = None) -> str:
+        """Обработка сообщения пользователя (language - новый язык сессии, если задан)."""
+        with self._lock:
+            self._evict_expired()
+        
         if not self.model:
             return "Чат-бот недоступен. Проверьте настройки Gemini API."
         
@@ -172,6 +286,9 @@ class FraudChatbot:
         context = self.get_session(session_id)
         if not context:
             context = self.create_session(session_id)
+        previous_mode = context.mode
+        if language and language != context.language:
+            self._set_language(context, language)
         
         # Добавляем сообщение пользователя
         context.add_message("user", message)
@@ -200,43 +317,32 @@ class FraudChatbot:
             error_msg = "Извините, произошла ошибка. Попробуйте переформулировать вопрос."
             context.add_message("assistant", error_msg)
             return error_msg
+        
+        finally:
+            self._track_mode_change(previous_mode, context)
     
     def _detect_intent(self, context: ConversationContext, message: str):
         """Определение намерения пользователя."""
-        message_lower = message.lower()
-        
-        # Ключевые слова для разных режимов
-        transaction_keywords = ['транзакция', 'платеж', 'перевод', 'transaction', 'payment', 'transfer']
-        security_keywords = ['безопасность', 'защита', 'мошенник', 'security', 'fraud', 'scam']
-        help_keywords = ['помощь', 'как работает', 'что умеет', 'help', 'how', 'what can']
-        
-        if any(keyword in message_lower for keyword in transaction_keywords):
-            context.mode = ChatbotMode.TRANSACTION_ANALYSIS
-        elif any(keyword in message_lower for keyword in security_keywords):
-            context.mode = ChatbotMode.SECURITY_ADVICE
-        elif any(keyword in message_lower for keyword in help_keywords):
-            context.mode = ChatbotMode.SYSTEM_HELP
-        else:
-            context.mode = ChatbotMode.GENERAL
+        for mode, pattern in INTENT_PATTERNS:
+            if pattern.search(message):
+                context.mode = mode
+                return
+        
+        context.mode = ChatbotMode.GENERAL
     
     def _generate_response(self, context: ConversationContext, message: str) -> str:
         """Генерация ответа на основе контекста."""
-        # Подготавливаем системный промпт
-        system_prompt = self._build_system_prompt(context)
-        
-        # Подготавливаем историю разговора
-        conversation_history = self._build_conversation_history(context)
-        
-        # Формируем полный промпт
-        full_prompt = f"""{system_prompt}
-
-История разговора:
-{conversation_history}
-
-Текущий вопрос пользователя: {message}
-
-Ответь на вопрос пользователя, учитывая контекст разговора и режим работы. 
-Будь полезным, точным и дружелюбным. Используй язык: {context.language}"""
+        # Сессия Gemini переиспользуется, пока не сменились режим, язык или транзакция.
+        # Gemini отправляет всю историю сессии с каждым сообщением, поэтому
+        # сессия пересоздается и когда история выходит за окно CHAT_HISTORY_WINDOW
+        transaction_ts = context.current_transaction["timestamp"] if context.current_transaction else None
+        session_key = (context.mode, context.language, transaction_ts)
+        if (context.chat_session is None or context.chat_session_key != session_key
+                or len(context.chat_session.history) > 2 + CHAT_HISTORY_WINDOW):
+            context.chat_session = self.model.start_chat(
+                history=self._build_conversation_history(context)
+            )
+            context.chat_session_key = session_key
         
         # Настройки генерации
         generation_config = genai.types.GenerationConfig(
@@ -244,28 +350,44 @@ class FraudChatbot:
             max_output_tokens=800,
         )
         
-        response = self.model.generate_content(full_prompt, generation_config=generation_config)
+        response = context.chat_session.send_message(message, generation_config=generation_config)
         return response.text.strip() if response.text else "Не удалось сгенерировать ответ."
     
-    def _build_system_prompt(self, context: ConversationContext) -> str:
-        """Построение системного промпта."""
-        lang = context.language
-        kb = self.knowledge_base[lang]
+    def _get_static_prompt(self, lang: str, mode: ChatbotMode) -> Tuple[str, str]:
+        """Неизменяемые начало и окончание системного промпта для языка и режима."""
+        key = (lang, mode)
+        cached = self._prompt_cache.get(key)
+        if cached is not None:
+            return cached
         
-        base_prompt = f"""Ты AI-ассистент системы детекции мошенничества. 
+        kb = self.knowledge_base[lang]
+        prefix = f"""Ты AI-ассистент системы детекции мошенничества. 
 Язык общения: {lang}
-Режим работы: {context.mode.value}
+Режим работы: {mode.value}
 
 Твои возможности:
-{chr(10).join('- ' + feature for feature in kb['system_features'])}
+{kb.system_features_block}
 
-Контекст сессии: {context.get_context_summary()}"""
+"""
+        suffix = ""
+        if mode == ChatbotMode.SECURITY_ADVICE:
+            suffix = f"""
+
+СОВЕТЫ ПО БЕЗОПАСНОСТИ:
+{kb.security_tips_block}"""
         
-        # Добавляем специфичную информацию в зависимости от режима
-        if context.mode == ChatbotMode.TRANSACTION_ANALYSIS:
-            if context.current_transaction:
-                result = context.current_transaction["result"]
-                base_prompt += f"""
+        self._prompt_cache[key] = (prefix, suffix)
+        return prefix, suffix
+    
+    def _build_system_prompt(self, context: ConversationContext) -> str:
+        """Построение системного промпта."""
+        prefix, suffix = self._get_static_prompt(context.language, context.mode)
+        base_prompt = f"{prefix}Контекст сессии: {context.get_context_summary()}"
+        
+        # Добавляем информацию о транзакции, если она есть
+        if context.mode == ChatbotMode.TRANSACTION_ANALYSIS and context.current_transaction:
+            result = context.current_transaction["result"]
+            base_prompt += f"""
 
 КОНТЕКСТ ТРАНЗАКЦИИ:
 - Вероятность мошенничества: {result.get('fraud_score', 0):.4f}
@@ -273,22 +395,31 @@ class FraudChatbot:
 - Уровень риска: {result.get('risk_level', 'unknown')}
 - Сумма: {context.current_transaction['data'].get('Amount', 0)}"""
         
-        elif context.mode == ChatbotMode.SECURITY_ADVICE:
-            base_prompt += f"""
+        return base_prompt + suffix
+    
+    def _build_conversation_history(self, context: ConversationContext) -> List[Dict[str, Any]]:
+        """Построение истории разговора для новой сессии Gemini."""
+        system_prompt = self._build_system_prompt(context)
+        instructions = f"""{system_prompt}
 
-СОВЕТЫ ПО БЕЗОПАСНОСТИ:
-{chr(10).join('- ' + tip for tip in kb['security_tips'])}"""
+Отвечай на вопросы пользователя, учитывая контекст разговора и режим работы. 
+Будь полезным, точным и дружелюбным. Используй язык: {context.language}"""
         
-        return base_prompt
-    
-    def _build_conversation_history(self, context: ConversationContext) -> str:
-        """Построение истории разговора."""
-        history_lines = []
-        for msg in context.history[-10:]:  # Последние 10 сообщений
-            role = "Пользователь" if msg["role"] == "user" else "Ассистент"
-            history_lines.append(f"{role}: {msg['content']}")
-        
-        return "\n".join(history_lines)
+        history = [
+            {"role": "user", "parts": [instructions]},
+            {"role": "model", "parts": ["OK"]}
+        ]
+        
+        # Последние CHAT_HISTORY_WINDOW сообщений без текущего вопроса пользователя
+        total = len(context.history)
+        for msg in islice(context.history, max(0, total - 1 - CHAT_HISTORY_WINDOW), max(0, total - 1)):
+            role = "user" if msg["role"] == "user" else "model"
+            if history[-1]["role"] == role:
+                history[-1]["parts"].append(msg["content"])
+            else:
+                history.append({"role": role, "parts": [msg["content"]]})
+        
+        return history
     
     def get_suggested_questions(self, session_id: str) -> List[str]:
         """Получение предлагаемых вопросов."""
@@ -326,27 +457,42 @@ class FraudChatbot:
     
     def clear_session(self, session_id: str):
         """Очистка сессии."""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            logger.info(f"Сессия {session_id} очищена")
+        with self._lock:
+            if self._remove_session(session_id) is not None:
+                logger.info(f"Сессия {session_id} очищена")
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Получение статистики сессий."""
-        return {
-            "total_sessions": len(self.sessions),
-            "active_sessions": len([s for s in self.sessions.values() 
-                                  if (datetime.now() - s.created_at).seconds < 3600]),
-            "languages": list(set(s.language for s in self.sessions.values())),
-            "modes": list(set(s.mode.value for s in self.sessions.values()))
-        }
+        with self._lock:
+            self._evict_expired()
+            # Неактивные сессии удаляются, поэтому все хранимые сессии активны
+            return {
+                "total_sessions": len(self.sessions),
+                "active_sessions": len(self.sessions),
+                "languages": [lang for lang, count in self._language_counts.items() if count > 0],
+                "modes": [mode.value for mode, count in self._mode_counts.items() if count > 0]
+            }
 
-# Глобальный экземпляр чат-бота
-fraud_chatbot = FraudChatbot()
+# Глобальный экземпляр чат-бота создается при первом обращении,
+# чтобы импорт модуля не инициализировал Gemini
+_fraud_chatbot: Optional[FraudChatbot] = None
+_fraud_chatbot_lock = threading.Lock()
+
+def get_chatbot() -> FraudChatbot:
+    """Получение глобального экземпляра чат-бота (ленивый синглтон)."""
+    global _fraud_chatbot
+    if _fraud_chatbot is None:
+        with _fraud_chatbot_lock:
+            if _fraud_chatbot is None:
+                _fraud_chatbot = FraudChatbot()
+    return _fraud_chatbot
 
 def chat_with_bot(session_id: str, message: str, language: str = 'ru',
                   transaction_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Основная функция для общения с чат-ботом."""
     try:
+        fraud_chatbot = get_chatbot()
+        
         # Создаем сессию если не существует
         if not fraud_chatbot.get_session(session_id):
             fraud_chatbot.create_session(session_id, language)
@@ -373,10 +519,54 @@ def chat_with_bot(session_id: str, message: str, language: str = 'ru',
             "error": str(e)
         }
 
+def chat_batch_with_bot(session_id: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Обработка нескольких сообщений одной сессии по порядку.
+    
+    Args:
+        session_id: ID сессии
+        messages: Сообщения вида {message, language?, transaction_context?};
+            язык сообщения становится языком сессии
+    
+    Returns:
+        Dict[str, Any]: Ответы на сообщения в поле 'responses'
+    """
+    responses = []
+    try:
+        fraud_chatbot = get_chatbot()
+        
+        # Сессия создается и проверяется один раз на все сообщения
+        if not fraud_chatbot.get_session(session_id):
+            fraud_chatbot.create_session(session_id, messages[0].get("language", "ru"))
+        
+        for item in messages:
+            response = fraud_chatbot.process_message(
+                session_id, item["message"], item.get("transaction_context"),
+                item.get("language", "ru")
+            )
+            responses.append({
+                "response": response,
+                "suggestions": fraud_chatbot.get_suggested_questions(session_id)
+            })
+        
+        return {
+            "responses": responses,
+            "session_id": session_id,
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"Ошибка в чат-боте: {e}")
+        return {
+            "responses": responses,
+            "session_id": session_id,
+            "error": str(e)
+        }
+
 def get_chatbot_stats() -> Dict[str, Any]:
     """Получение статистики чат-бота."""
-    return fraud_chatbot.get_session_stats()
+    return get_chatbot().get_session_stats()
 
 def clear_chatbot_session(session_id: str):
     """Очистка сессии чат-бота."""
-    fraud_chatbot.clear_session(session_id)
+    get_chatbot().clear_session(session_id)
@@ -10,20 +10,49 @@
 
 import os
 import json
+import time
 import logging
+import operator
+import itertools
+import threading
 import numpy as np
-from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
 
 logger = logging.getLogger(__name__)
 
 try:
-    import google.generativeai as genai
-except Exception as e:
-    genai = None
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def _dumps_pretty(obj: Any) -> str:
+        """JSON с отступом 2 для промпта (UTF-8 без экранирования)."""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+    def _dumps_line(obj: Any) -> str:
+        """Компактный JSON в одну строку."""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    _loads = orjson.loads
+else:
+    def _dumps_pretty(obj: Any) -> str:
+        """JSON с отступом 2 для промпта (UTF-8 без экранирования)."""
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+
+    def _dumps_line(obj: Any) -> str:
+        """Компактный JSON в одну строку."""
+        return json.dumps(obj, ensure_ascii=False)
+
+    _loads = json.loads
 
 # Языковые настройки
 SUPPORTED_LANGUAGES = {
@@ -63,19 +92,251 @@ LANGUAGE_PROMPTS = {
     }
 }
 
+# Хранение исторических случаев: по одному JSON на строку, новые случаи дописываются
+CASES_FILE = Path("data/historical_cases.jsonl")
+LEGACY_CASES_FILE = Path("data/historical_cases.json")
+MAX_HISTORY_CASES = int(os.environ.get("MAX_HISTORY_CASES", 1000))
+
+# HNSW индекс (hnswlib) для поиска похожих случаев строится только для больших баз:
+# на тысячах случаев полный перебор одним матрично-векторным произведением быстрее
+SIMILARITY_INDEX_MIN_CASES = int(os.environ.get("SIMILARITY_INDEX_MIN_CASES", 50000))
+SIMILARITY_INDEX_EF = int(os.environ.get("SIMILARITY_INDEX_EF", 256))
+
+# Кэш результатов поиска похожих случаев (по признакам транзакции и top_k)
+SIMILAR_CACHE_SIZE = int(os.environ.get("SIMILAR_CACHE_SIZE", 1024))
+
+# Признаки для поиска похожих случаев: Amount, V1-V28 (отсутствующие считаются нулями).
+# Все векторы и матрица признаков хранятся в _FEATURE_DTYPE без промежуточных преобразований
+_FEATURE_DTYPE = np.float32
+_FEATURE_KEYS = ("Amount",) + tuple(f"V{i}" for i in range(1, 29))
+_ZERO_FEATURES = dict.fromkeys(_FEATURE_KEYS, 0)
+_get_features = operator.itemgetter(*_FEATURE_KEYS)
+_V_NAMES = _FEATURE_KEYS[1:]
+
+# Шаблон промпта расширенного объяснения: %(...)s заполняются языковыми
+# заголовками при импорте, {...} - данными транзакции при каждом вызове
+_PROMPT_TEMPLATE = """%(system)s
+
+%(analysis_header)s:
+• Сумма транзакции: {amount:.2f}
+• Вероятность мошенничества: {score:.4f} ({score_pct:.2f}%%)
+• Порог классификации: {threshold}
+• Решение: {decision}
+• Уровень риска: {risk_level}
+• Уверенность: {confidence:.4f}
+
+%(risk_factors)s:
+{transaction_json}
+
+%(similar_cases)s:
+{similar_cases_json}
+
+%(anomaly_analysis)s:
+Обнаруженные аномалии: {anomaly_count}
+Уровень серьезности: {severity_level}
+Типы паттернов: {pattern_types}
+
+%(recommendations)s:
+{recommendations_json}
+
+ЗАДАЧА: Проанализируй эту транзакцию и дай профессиональное объяснение на языке %(language_name)s. 
+
+Структура ответа:
+**%(risk_factors)s**
+- Детальный анализ факторов риска
+- Объяснение значимых признаков
+- Сравнение с нормальными транзакциями
+
+**%(similar_cases)s**
+- Анализ найденных похожих случаев
+- Выводы на основе исторических данных
+- Паттерны поведения
+
+**%(anomaly_analysis)s**
+- Детальное объяснение обнаруженных аномалий
+- Степень отклонения от нормы
+- Потенциальные причины
+
+**%(model_interpretation)s**
+- Объяснение решения модели
+- Ключевые факторы влияния
+- Надежность предсказания
+
+**%(recommendations)s**
+- Конкретные действия
+- Превентивные меры
+- Долгосрочные рекомендации
+
+Пиши профессионально и структурированно. Используй эмодзи для наглядности."""
+
+_PROMPT_TEMPLATES = {
+    lang: _PROMPT_TEMPLATE % dict(prompts, language_name=SUPPORTED_LANGUAGES[lang])
+    for lang, prompts in LANGUAGE_PROMPTS.items()
+}
+
+# Рекомендации по уровню риска и шаблон проверки крупной суммы для каждого языка
+_RECO_TABLES = {
+    'ru': {
+        'fraud': (
+            {"type": "immediate", "action": "Немедленно заблокировать транзакцию"},
+            {"type": "investigation", "action": "Провести детальное расследование"},
+            {"type": "contact", "action": "Связаться с клиентом для подтверждения"}
+        ),
+        'high_risk': (
+            {"type": "monitoring", "action": "Усилить мониторинг клиента"},
+            {"type": "verification", "action": "Дополнительная верификация"},
+            {"type": "limits", "action": "Временно снизить лимиты"}
+        ),
+        'amount_check': "Проверить источник крупной суммы ({amount})"
+    },
+    'en': {
+        'fraud': (
+            {"type": "immediate", "action": "Immediately block the transaction"},
+            {"type": "investigation", "action": "Conduct detailed investigation"},
+            {"type": "contact", "action": "Contact customer for verification"}
+        ),
+        'high_risk': (
+            {"type": "monitoring", "action": "Enhance customer monitoring"},
+            {"type": "verification", "action": "Additional verification required"},
+            {"type": "limits", "action": "Temporarily reduce limits"}
+        ),
+        'amount_check': "Verify source of large amount ({amount})"
+    },
+    'kk': {
+        'fraud': (
+            {"type": "immediate", "action": "Транзакцияны дереу блоктау"},
+            {"type": "investigation", "action": "Толық тергеу жүргізу"},
+            {"type": "contact", "action": "Растау үшін клиентпен байланысу"}
+        ),
+        'high_risk': (
+            {"type": "monitoring", "action": "Клиентті күшейтілген бақылау"},
+            {"type": "verification", "action": "Қосымша растау қажет"},
+            {"type": "limits", "action": "Уақытша лимиттерді төмендету"}
+        ),
+        'amount_check': "Үлкен сомманың көзін тексеру ({amount})"
+    }
+}
+
+def _make_reco_builder(table: Dict[str, Any]) -> Callable[[bool, bool, List[Dict], Any], List[Dict[str, str]]]:
+    """
+    Построитель рекомендаций для одного языка.
+    
+    Args:
+        table: Таблица рекомендаций языка из _RECO_TABLES
+        
+    Returns:
+        Callable: Функция (is_fraud, high_risk, detected_anomalies, amount) -> рекомендации
+    """
+    fraud_actions = table['fraud']
+    high_risk_actions = table['high_risk']
+    amount_check = table['amount_check']
+    
+    def build(is_fraud: bool, high_risk: bool, detected_anomalies: List[Dict], amount: Any) -> List[Dict[str, str]]:
+        # Рекомендации на основе уровня риска
+        if is_fraud:
+            recommendations = [dict(r) for r in fraud_actions]
+        elif high_risk:
+            recommendations = [dict(r) for r in high_risk_actions]
+        else:
+            recommendations = []
+        
+        # Рекомендации на основе аномалий
+        recommendations.extend(
+            {"type": "amount_check", "action": amount_check.format(amount=amount)}
+            for anomaly in detected_anomalies if anomaly["type"] == "high_amount"
+        )
+        return recommendations
+    
+    return build
+
+_RECO_BUILDERS = {lang: _make_reco_builder(table) for lang, table in _RECO_TABLES.items()}
+
+# Порог экстремального значения PCA признака (в стандартных отклонениях)
+EXTREME_FEATURE_THRESHOLD = 3.0
+
+def _extreme_mask(values: np.ndarray) -> np.ndarray:
+    """Маска признаков, выходящих за EXTREME_FEATURE_THRESHOLD."""
+    return np.abs(values) > EXTREME_FEATURE_THRESHOLD
+
+def _prompt_blob(case: Dict) -> Dict[str, Any]:
+    """Описание исторического случая для промпта (случаи не меняются после сохранения)."""
+    return {
+        'описание': case.get('description', ''),
+        'тип_паттерна': case.get('pattern_type', ''),
+        'риск_скор': case.get('risk_score', 0),
+        'мошенничество': case.get('is_fraud', False)
+    }
+
 class EnhancedFraudExplainer:
     """Расширенная система объяснений мошенничества."""
     
     def __init__(self):
-        self.model = None
-        self.similar_cases_db = []
+        # Gemini SDK и модель, база случаев загружаются при первом обращении
+        self._genai = None
+        self._model = None
+        self._model_ready = False
+        self._model_lock = threading.Lock()
+        self._similar_cases_db: List[Dict] = []
+        self._cases_loaded = False
+        self._cases_loading = False
+        # Нормализованные признаки исторических случаев, форма (N, 29)
+        self._cases_matrix = np.empty((0, 29), dtype=_FEATURE_DTYPE)
+        # Описания случаев для промпта, в порядке строк матрицы
+        self._prompt_blobs: List[Dict[str, Any]] = []
         self.anomaly_patterns = {}
-        self._init_model()
-        self._load_historical_cases()
+        # Количество строк в CASES_FILE (для сжатия файла)
+        self._cases_file_lines = 0
+        self._history_lock = threading.RLock()
+        # Счетчик делает id уникальными для случаев, сохраненных в одну наносекунду
+        self._case_counter = itertools.count()
+        # Версия базы случаев входит в ключ кэша и меняется при каждом изменении базы
+        self._cases_version = 0
+        # HNSW индекс по строкам матрицы; метка строки i равна _index_base + i
+        self._similarity_index = None
+        self._index_base = 0
+        self._index_lock = threading.Lock()
+        self._similar_cache = lru_cache(maxsize=SIMILAR_CACHE_SIZE)(self._similar_indices)
+    
+    @property
+    def model(self):
+        """Gemini модель (создается при первом обращении)."""
+        if not self._model_ready:
+            with self._model_lock:
+                if not self._model_ready:
+                    self._init_model()
+                    self._model_ready = True
+        return self._model
+    
+    @property
+    def similar_cases_db(self) -> List[Dict]:
+        """База исторических случаев (загружается при первом обращении)."""
+        if not self._cases_loaded:
+            with self._history_lock:
+                if not self._cases_loaded and not self._cases_loading:
+                    # Флаг загрузки выставляется только после построения матрицы,
+                    # иначе другие потоки видят пустую базу во время загрузки
+                    self._cases_loading = True
+                    try:
+                        self._load_historical_cases()
+                    finally:
+                        self._cases_loading = False
+                        self._cases_loaded = True
+        return self._similar_cases_db
+    
+    @similar_cases_db.setter
+    def similar_cases_db(self, cases: List[Dict]):
+        self._similar_cases_db = cases
+        if not self._cases_loading:
+            self._cases_loaded = True
     
     def _init_model(self):
         """Инициализация Gemini модели."""
         api_key = os.environ.get("GEMINI_API_KEY")
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            genai = None
+        
         if not api_key or genai is None:
             logger.warning("Gemini API недоступен")
             return
@@ -83,7 +344,8 @@ class EnhancedFraudExplainer:
         try:
             genai.configure(api_key=api_key)
             model_name = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash-exp")
-            self.model = genai.GenerativeModel(model_name)
+            self._model = genai.GenerativeModel(model_name)
+            self._genai = genai
             logger.info(f"Enhanced Gemini модель инициализирована ({model_name})")
         except Exception as e:
             logger.error(f"Ошибка инициализации Gemini: {e}")
@@ -91,17 +353,55 @@ class EnhancedFraudExplainer:
     def _load_historical_cases(self):
         """Загрузка исторических случаев для поиска похожих."""
         try:
-            cases_file = Path("data/historical_cases.json")
-            if cases_file.exists():
-                with open(cases_file, 'r', encoding='utf-8') as f:
-                    self.similar_cases_db = json.load(f)
-                logger.info(f"Загружено {len(self.similar_cases_db)} исторических случаев")
+            if CASES_FILE.exists():
+                cases = []
+                with open(CASES_FILE, 'r', encoding='utf-8') as f:
+                    for line_number, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            cases.append(_loads(line))
+                        except ValueError:
+                            logger.warning(f"Пропущена поврежденная строка {line_number} в {CASES_FILE}")
+                self._cases_file_lines = len(cases)
+                self.similar_cases_db = self._drop_malformed_cases(cases, CASES_FILE)[-MAX_HISTORY_CASES:]
+            elif LEGACY_CASES_FILE.exists():
+                # Старый формат: весь список в одном JSON (перепишется в CASES_FILE при сохранении)
+                with open(LEGACY_CASES_FILE, 'r', encoding='utf-8') as f:
+                    self.similar_cases_db = self._drop_malformed_cases(_loads(f.read()), LEGACY_CASES_FILE)
             else:
                 # Создаем базовые примеры
                 self._create_sample_cases()
+                return
+            self._rebuild_matrix()
+            logger.info(f"Загружено {len(self.similar_cases_db)} исторических случаев")
         except Exception as e:
+            # Файл истории существует: примеры вместо него не подставляются,
+            # иначе при следующем сохранении они заменили бы историю на диске
             logger.error(f"Ошибка загрузки исторических случаев: {e}")
-            self._create_sample_cases()
+            self.similar_cases_db = []
+            self._rebuild_matrix()
+    
+    def _drop_malformed_cases(self, cases: List[Any], source: Path) -> List[Dict]:
+        """
+        Случаи, признаки которых можно рассчитать (остальные пропускаются с предупреждением).
+        
+        Args:
+            cases: Загруженные случаи
+            source: Файл, из которого они загружены (для сообщения)
+            
+        Returns:
+            List[Dict]: Корректные случаи в исходном порядке
+        """
+        valid_cases = []
+        for number, case in enumerate(cases, 1):
+            try:
+                self._extract_features(case["transaction"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Пропущен поврежденный случай {number} в {source}")
+                continue
+            valid_cases.append(case)
+        return valid_cases
     
     def _create_sample_cases(self):
         """Создание примеров исторических случаев."""
@@ -123,53 +423,193 @@ class EnhancedFraudExplainer:
                 "risk_score": 0.05
             }
         ]
+        self._rebuild_matrix()
+    
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        """L2-нормализация строк матрицы признаков."""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.clip(norms, 1e-12, None)
+    
+    def _case_rows(self, cases: List[Dict]) -> np.ndarray:
+        """Нормализованные признаки случаев, форма (len(cases), 29)."""
+        if not cases:
+            return np.empty((0, 29), dtype=_FEATURE_DTYPE)
+        matrix = np.stack([self._extract_features(case["transaction"]) for case in cases])
+        return self._normalize_rows(matrix)
+    
+    def _rebuild_matrix(self):
+        """Пересчет матрицы признаков после изменения базы случаев."""
+        matrix = self._case_rows(self.similar_cases_db)
+        blobs = [_prompt_blob(case) for case in self.similar_cases_db]
+        with self._index_lock:
+            self._cases_matrix = matrix
+            self._prompt_blobs = blobs
+            self._similarity_index = None
+        self._invalidate_similar_cache()
+    
+    def _append_cases(self, cases: List[Dict], n_dropped: int = 0,
+                      rows: Optional[np.ndarray] = None):
+        """
+        Добавление случаев в матрицу признаков и индекс.
+        
+        Args:
+            cases: Новые случаи (уже добавленные в базу)
+            n_dropped: Сколько старейших случаев удалить из начала
+            rows: Уже рассчитанные строки признаков случаев (_case_rows)
+        """
+        if rows is None:
+            rows = self._case_rows(cases)
+        blobs = (self._prompt_blobs + [_prompt_blob(case) for case in cases])[n_dropped:]
+        with self._index_lock:
+            old_matrix = self._cases_matrix
+            matrix = np.vstack([old_matrix, rows])[n_dropped:]
+            index = self._similarity_index
+            if index is not None:
+                first = self._index_base + len(old_matrix)
+                needed = index.get_current_count() + len(rows)
+                if needed > index.get_max_elements():
+                    index.resize_index(2 * needed)
+                index.add_items(rows, np.arange(first, first + len(rows)))
+                for label in range(self._index_base, self._index_base + n_dropped):
+                    index.mark_deleted(label)
+                self._index_base += n_dropped
+                # Удаленные случаи остаются в графе; при их избытке индекс строится заново
+                if index.get_current_count() > 2 * len(matrix):
+                    self._similarity_index = None
+            self._cases_matrix = matrix
+            self._prompt_blobs = blobs
+        self._invalidate_similar_cache()
+    
+    def _invalidate_similar_cache(self):
+        """Сброс кэша похожих случаев после изменения базы."""
+        self._cases_version += 1
+        self._similar_cache.cache_clear()
     
     def find_similar_cases(self, transaction: Dict[str, Any], top_k: int = 3) -> List[Dict]:
-        """Поиск похожих исторических случаев."""
+        """Поиск похожих исторических случаев (нечисловые признаки - ValueError/TypeError)."""
+        with self._history_lock:
+            # Индексы и база читаются под блокировкой, как в _similar_prompt_blobs
+            indices = self._find_similar_indices(transaction, top_k)
+            cases = self.similar_cases_db
+            return [cases[i] for i in indices]
+    
+    def _find_similar_indices(self, transaction: Dict[str, Any], top_k: int) -> Tuple[int, ...]:
+        """Индексы похожих случаев в базе (пустой кортеж при ошибке поиска)."""
         if not self.similar_cases_db:
-            return []
+            return ()
         
+        features = self._extract_features(transaction)
         try:
-            # Извлекаем числовые признаки для сравнения
-            current_features = self._extract_features(transaction)
-            similarities = []
-            
-            for case in self.similar_cases_db:
-                case_features = self._extract_features(case["transaction"])
-                similarity = self._calculate_similarity(current_features, case_features)
-                similarities.append((similarity, case))
-            
-            # Сортируем по убыванию схожести
-            similarities.sort(key=lambda x: x[0], reverse=True)
-            
-            return [case for _, case in similarities[:top_k]]
-            
+            return self._similar_cache(features.tobytes(), top_k, self._cases_version)
         except Exception as e:
             logger.error(f"Ошибка поиска похожих случаев: {e}")
-            return []
+            return ()
     
-    def _extract_features(self, transaction: Dict[str, Any]) -> np.ndarray:
-        """Извлечение числовых признаков из транзакции."""
-        features = []
+    def _similar_prompt_blobs(self, transaction: Dict[str, Any], top_k: int) -> List[Dict[str, Any]]:
+        """Описания похожих случаев для промпта (индексы и описания из одной версии базы)."""
+        with self._history_lock:
+            # Поиск загружает базу при первом обращении, поэтому описания
+            # читаются после него; блокировка не дает изменить базу между чтениями
+            indices = self._find_similar_indices(transaction, top_k)
+            prompt_blobs = self._prompt_blobs
+            return [prompt_blobs[i] for i in indices]
+    
+    def _similar_indices(self, feature_bytes: bytes, top_k: int, cases_version: int) -> Tuple[int, ...]:
+        """
+        Индексы похожих случаев для вектора признаков (кэшируется в find_similar_cases).
+        
+        Args:
+            feature_bytes: Признаки транзакции (_FEATURE_DTYPE) в виде байтов
+            top_k: Количество похожих случаев
+            cases_version: Версия базы случаев (часть ключа кэша)
+            
+        Returns:
+            Tuple[int, ...]: Индексы случаев по убыванию сходства
+        """
+        query = self._normalize_rows(
+            np.frombuffer(feature_bytes, dtype=_FEATURE_DTYPE).reshape(1, -1)
+        ).ravel()
         
-        # Добавляем Amount
-        features.append(transaction.get("Amount", 0))
+        matrix = self._cases_matrix
+        if hnswlib is None or len(matrix) < SIMILARITY_INDEX_MIN_CASES or top_k <= 0:
+            # Косинусное сходство со всеми случаями одним матрично-векторным произведением
+            similarities = matrix @ query
+            return tuple(int(i) for i in self._top_indices(similarities, top_k))
         
-        # Добавляем V1-V28
-        for i in range(1, 29):
-            features.append(transaction.get(f"V{i}", 0))
+        with self._index_lock:
+            matrix = self._cases_matrix
+            index = self._similarity_index or self._build_similarity_index()
+            index.set_ef(max(SIMILARITY_INDEX_EF, top_k))
+            labels, _ = index.knn_query(query, k=min(top_k, len(matrix)), num_threads=1)
+            candidates = np.sort(labels[0].astype(np.int64) - self._index_base)
         
-        return np.array(features).reshape(1, -1)
+        # Кандидаты из индекса упорядочиваются по точному сходству, как при переборе
+        similarities = matrix[candidates] @ query
+        return tuple(int(i) for i in candidates[self._top_indices(similarities, top_k)])
     
-    def _calculate_similarity(self, features1: np.ndarray, features2: np.ndarray) -> float:
-        """Расчет косинусного сходства между признаками."""
-        try:
-            return cosine_similarity(features1, features2)[0][0]
-        except:
-            return 0.0
+    def _build_similarity_index(self):
+        """
+        Построение HNSW индекса по матрице признаков (вызывается под _index_lock).
+        
+        Returns:
+            hnswlib.Index: Индекс по скалярному произведению нормализованных строк
+        """
+        matrix = self._cases_matrix
+        index = hnswlib.Index(space='ip', dim=matrix.shape[1])
+        index.init_index(max_elements=2 * len(matrix), ef_construction=200, M=16)
+        index.add_items(matrix, np.arange(len(matrix)))
+        self._similarity_index = index
+        self._index_base = 0
+        logger.info(f"Построен HNSW индекс похожих случаев ({len(matrix)} случаев)")
+        return index
+    
+    def find_similar_cases_batch(self, transactions: List[Dict[str, Any]], top_k: int = 3) -> List[List[Dict]]:
+        """
+        Поиск похожих исторических случаев для нескольких транзакций сразу.
+        
+        Args:
+            transactions: Список транзакций
+            top_k: Количество похожих случаев на транзакцию
+            
+        Returns:
+            List[List[Dict]]: Похожие случаи для каждой транзакции (в порядке входа)
+        """
+        if not self.similar_cases_db or not transactions:
+            return [[] for _ in transactions]
+        
+        queries = self._normalize_rows(np.stack(
+            [self._extract_features(transaction) for transaction in transactions]
+        ))
+        # База и матрица берутся под блокировкой: строка i матрицы - случай i этой базы
+        with self._history_lock:
+            cases = self.similar_cases_db
+            matrix = self._cases_matrix
+        # Сходство всех запросов со всеми случаями одним матричным произведением
+        similarities = queries @ matrix.T
+        return [
+            [cases[i] for i in self._top_indices(row, top_k)]
+            for row in similarities
+        ]
+    
+    @staticmethod
+    def _top_indices(similarities: np.ndarray, top_k: int) -> np.ndarray:
+        """Индексы top_k случаев по убыванию сходства (при равенстве - в порядке базы)."""
+        n_cases = len(similarities)
+        if top_k <= 0:
+            return np.empty(0, dtype=np.intp)
+        if top_k < n_cases:
+            top = np.argpartition(-similarities, top_k - 1)[:top_k]
+        else:
+            top = np.arange(n_cases)
+        return top[np.lexsort((top, -similarities[top]))]
+    
+    def _extract_features(self, transaction: Dict[str, Any]) -> np.ndarray:
+        """Извлечение числовых признаков из транзакции."""
+        return np.array(_get_features({**_ZERO_FEATURES, **transaction}), dtype=_FEATURE_DTYPE)
     
     def analyze_anomalies(self, transaction: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
-        """Детальный анализ аномальных паттернов."""
+        """Детальный анализ аномальных паттернов (транзакция проверяется заранее, при предсказании)."""
         anomalies = {
             "detected_anomalies": [],
             "severity_level": "low",
@@ -177,130 +617,73 @@ class EnhancedFraudExplainer:
             "pattern_types": []
         }
         
-        try:
-            amount = transaction.get("Amount", 0)
-            fraud_score = result.get("fraud_score", 0)
-            
-            # Анализ суммы
-            if amount > 5000:
-                anomalies["detected_anomalies"].append({
-                    "type": "high_amount",
-                    "description": f"Необычно высокая сумма: {amount}",
-                    "severity": "high"
-                })
-                anomalies["pattern_types"].append("large_transaction")
-            
-            if amount < 1:
-                anomalies["detected_anomalies"].append({
-                    "type": "micro_transaction", 
-                    "description": f"Микротранзакция: {amount}",
-                    "severity": "medium"
-                })
-                anomalies["pattern_types"].append("micro_payment")
-            
-            # Анализ PCA признаков
-            extreme_features = []
-            for i in range(1, 29):
-                v_val = transaction.get(f"V{i}", 0)
-                if abs(v_val) > 3:  # Значения за пределами 3 стандартных отклонений
-                    extreme_features.append(f"V{i}")
-            
-            if extreme_features:
-                anomalies["detected_anomalies"].append({
-                    "type": "extreme_features",
-                    "description": f"Экстремальные значения признаков: {', '.join(extreme_features)}",
-                    "severity": "high" if len(extreme_features) > 5 else "medium"
-                })
-                anomalies["pattern_types"].append("feature_anomaly")
-            
-            # Определение общего уровня серьезности
-            high_severity_count = sum(1 for a in anomalies["detected_anomalies"] if a["severity"] == "high")
-            if high_severity_count > 0:
-                anomalies["severity_level"] = "high"
-                anomalies["anomaly_score"] = min(0.9, fraud_score + 0.2)
-            elif len(anomalies["detected_anomalies"]) > 0:
-                anomalies["severity_level"] = "medium"
-                anomalies["anomaly_score"] = fraud_score
-            
-        except Exception as e:
-            logger.error(f"Ошибка анализа аномалий: {e}")
+        fraud_score = result.get("fraud_score", 0)
+        
+        # Один проход по вектору признаков: маска PCA признаков за пределами
+        # 3 стандартных отклонений (Amount - первый элемент, V1-V28 - остальные).
+        # Сумма сравнивается как число: валидация пропускает числовые строки
+        features = self._extract_features(transaction)
+        amount = float(features[0])
+        # В описаниях сумма выводится как в запросе, без округления до float32
+        shown_amount = transaction.get("Amount", 0)
+        extreme_mask = _extreme_mask(features[1:])
+        n_extreme = int(np.count_nonzero(extreme_mask))
+        is_high_amount = amount > 5000
+        is_micro_amount = amount < 1
+        
+        # Общий уровень серьезности определяется до формирования описаний
+        high_severity_count = int(is_high_amount) + int(n_extreme > 5)
+        anomaly_count = int(is_high_amount) + int(is_micro_amount) + int(n_extreme > 0)
+        if high_severity_count > 0:
+            anomalies["severity_level"] = "high"
+            anomalies["anomaly_score"] = min(0.9, fraud_score + 0.2)
+        elif anomaly_count > 0:
+            anomalies["severity_level"] = "medium"
+            anomalies["anomaly_score"] = fraud_score
+        
+        if is_high_amount:
+            anomalies["detected_anomalies"].append({
+                "type": "high_amount",
+                "description": f"Необычно высокая сумма: {shown_amount}",
+                "severity": "high"
+            })
+            anomalies["pattern_types"].append("large_transaction")
+        
+        if is_micro_amount:
+            anomalies["detected_anomalies"].append({
+                "type": "micro_transaction", 
+                "description": f"Микротранзакция: {shown_amount}",
+                "severity": "medium"
+            })
+            anomalies["pattern_types"].append("micro_payment")
+        
+        if n_extreme:
+            extreme_features = [_V_NAMES[i] for i in np.flatnonzero(extreme_mask)]
+            anomalies["detected_anomalies"].append({
+                "type": "extreme_features",
+                "description": f"Экстремальные значения признаков: {', '.join(extreme_features)}",
+                "severity": "high" if n_extreme > 5 else "medium"
+            })
+            anomalies["pattern_types"].append("feature_anomaly")
         
         return anomalies
     
     def generate_recommendations(self, transaction: Dict[str, Any], result: Dict[str, Any], 
                                anomalies: Dict[str, Any], language: str = 'ru') -> List[Dict[str, str]]:
         """Генерация рекомендаций по снижению рисков."""
-        recommendations = []
+        # Для неподдерживаемого языка рекомендаций нет
+        build = _RECO_BUILDERS.get(language)
+        if build is None:
+            return []
         
         try:
-            fraud_score = result.get("fraud_score", 0)
             is_fraud = result.get("is_fraud", False)
-            amount = transaction.get("Amount", 0)
-            
-            # Рекомендации на основе уровня риска
-            if is_fraud:
-                if language == 'ru':
-                    recommendations.extend([
-                        {"type": "immediate", "action": "Немедленно заблокировать транзакцию"},
-                        {"type": "investigation", "action": "Провести детальное расследование"},
-                        {"type": "contact", "action": "Связаться с клиентом для подтверждения"}
-                    ])
-                elif language == 'en':
-                    recommendations.extend([
-                        {"type": "immediate", "action": "Immediately block the transaction"},
-                        {"type": "investigation", "action": "Conduct detailed investigation"},
-                        {"type": "contact", "action": "Contact customer for verification"}
-                    ])
-                elif language == 'kk':
-                    recommendations.extend([
-                        {"type": "immediate", "action": "Транзакцияны дереу блоктау"},
-                        {"type": "investigation", "action": "Толық тергеу жүргізу"},
-                        {"type": "contact", "action": "Растау үшін клиентпен байланысу"}
-                    ])
-            
-            elif fraud_score > 0.3:
-                if language == 'ru':
-                    recommendations.extend([
-                        {"type": "monitoring", "action": "Усилить мониторинг клиента"},
-                        {"type": "verification", "action": "Дополнительная верификация"},
-                        {"type": "limits", "action": "Временно снизить лимиты"}
-                    ])
-                elif language == 'en':
-                    recommendations.extend([
-                        {"type": "monitoring", "action": "Enhance customer monitoring"},
-                        {"type": "verification", "action": "Additional verification required"},
-                        {"type": "limits", "action": "Temporarily reduce limits"}
-                    ])
-                elif language == 'kk':
-                    recommendations.extend([
-                        {"type": "monitoring", "action": "Клиентті күшейтілген бақылау"},
-                        {"type": "verification", "action": "Қосымша растау қажет"},
-                        {"type": "limits", "action": "Уақытша лимиттерді төмендету"}
-                    ])
-            
-            # Рекомендации на основе аномалий
-            for anomaly in anomalies.get("detected_anomalies", []):
-                if anomaly["type"] == "high_amount":
-                    if language == 'ru':
-                        recommendations.append({
-                            "type": "amount_check", 
-                            "action": f"Проверить источник крупной суммы ({amount})"
-                        })
-                    elif language == 'en':
-                        recommendations.append({
-                            "type": "amount_check",
-                            "action": f"Verify source of large amount ({amount})"
-                        })
-                    elif language == 'kk':
-                        recommendations.append({
-                            "type": "amount_check",
-                            "action": f"Үлкен сомманың көзін тексеру ({amount})"
-                        })
-            
+            high_risk = not is_fraud and result.get("fraud_score", 0) > 0.3
+            return build(is_fraud, high_risk, anomalies.get("detected_anomalies", []),
+                         transaction.get("Amount", 0))
         except Exception as e:
             logger.error(f"Ошибка генерации рекомендаций: {e}")
-        
-        return recommendations
+            return []
     
     def generate_enhanced_explanation(self, transaction: Dict[str, Any], result: Dict[str, Any], 
                                     language: str = 'ru') -> str:
@@ -309,8 +692,8 @@ class EnhancedFraudExplainer:
             return "LLM недоступен: установите google-generativeai и задайте GEMINI_API_KEY"
         
         try:
-            # Поиск похожих случаев
-            similar_cases = self.find_similar_cases(transaction)
+            # Поиск похожих случаев: в промпт идут их готовые описания
+            similar_blobs = self._similar_prompt_blobs(transaction, 3)
             
             # Анализ аномалий
             anomalies = self.analyze_anomalies(transaction, result)
@@ -326,71 +709,25 @@ class EnhancedFraudExplainer:
             threshold = result.get("threshold", 0.5)
             amount = transaction.get("Amount", 0)
             
-            # Получение промптов для языка
-            prompts = LANGUAGE_PROMPTS.get(language, LANGUAGE_PROMPTS['ru'])
-            
-            # Формирование промпта
-            prompt = f"""{prompts['system']}
-
-{prompts['analysis_header']}:
-• Сумма транзакции: {amount:.2f}
-• Вероятность мошенничества: {score:.4f} ({score*100:.2f}%)
-• Порог классификации: {threshold}
-• Решение: {'🚨 МОШЕННИЧЕСТВО' if is_fraud else '✅ ЛЕГИТИМНАЯ'}
-• Уровень риска: {risk_level}
-• Уверенность: {confidence:.4f}
-
-{prompts['risk_factors']}:
-{json.dumps({k: round(v, 4) if isinstance(v, (int, float)) else v for k, v in transaction.items()}, ensure_ascii=False, indent=2)}
-
-{prompts['similar_cases']}:
-{json.dumps([{
-    'описание': case.get('description', ''),
-    'тип_паттерна': case.get('pattern_type', ''),
-    'риск_скор': case.get('risk_score', 0),
-    'мошенничество': case.get('is_fraud', False)
-} for case in similar_cases], ensure_ascii=False, indent=2)}
-
-{prompts['anomaly_analysis']}:
-Обнаруженные аномалии: {len(anomalies.get('detected_anomalies', []))}
-Уровень серьезности: {anomalies.get('severity_level', 'low')}
-Типы паттернов: {', '.join(anomalies.get('pattern_types', []))}
-
-{prompts['recommendations']}:
-{json.dumps([{'тип': r['type'], 'действие': r['action']} for r in recommendations], ensure_ascii=False, indent=2)}
-
-ЗАДАЧА: Проанализируй эту транзакцию и дай профессиональное объяснение на языке {SUPPORTED_LANGUAGES[language]}. 
-
-Структура ответа:
-**{prompts['risk_factors']}**
-- Детальный анализ факторов риска
-- Объяснение значимых признаков
-- Сравнение с нормальными транзакциями
-
-**{prompts['similar_cases']}**
-- Анализ найденных похожих случаев
-- Выводы на основе исторических данных
-- Паттерны поведения
-
-**{prompts['anomaly_analysis']}**
-- Детальное объяснение обнаруженных аномалий
-- Степень отклонения от нормы
-- Потенциальные причины
-
-**{prompts['model_interpretation']}**
-- Объяснение решения модели
-- Ключевые факторы влияния
-- Надежность предсказания
-
-**{prompts['recommendations']}**
-- Конкретные действия
-- Превентивные меры
-- Долгосрочные рекомендации
-
-Пиши профессионально и структурированно. Используй эмодзи для наглядности."""
+            # Формирование промпта по шаблону языка
+            prompt = _PROMPT_TEMPLATES[language].format(
+                amount=amount,
+                score=score,
+                score_pct=score * 100,
+                threshold=threshold,
+                decision='🚨 МОШЕННИЧЕСТВО' if is_fraud else '✅ ЛЕГИТИМНАЯ',
+                risk_level=risk_level,
+                confidence=confidence,
+                transaction_json=_dumps_pretty({k: round(v, 4) if isinstance(v, (int, float)) else v for k, v in transaction.items()}),
+                similar_cases_json=_dumps_pretty(similar_blobs),
+                anomaly_count=len(anomalies.get('detected_anomalies', [])),
+                severity_level=anomalies.get('severity_level', 'low'),
+                pattern_types=', '.join(anomalies.get('pattern_types', [])),
+                recommendations_json=_dumps_pretty([{'тип': r['type'], 'действие': r['action']} for r in recommendations])
+            )
 
             # Настройки генерации
-            generation_config = genai.types.GenerationConfig(
+            generation_config = self._genai.types.GenerationConfig(
                 temperature=float(os.environ.get("GEMINI_TEMPERATURE", "0.3")),
                 max_output_tokens=int(os.environ.get("GEMINI_MAX_TOKENS", "1000")),
             )
@@ -404,11 +741,15 @@ class EnhancedFraudExplainer:
     
     def save_case_to_history(self, transaction: Dict[str, Any], result: Dict[str, Any], 
                            feedback: Optional[bool] = None):
-        """Сохранение случая в историческую базу для обучения."""
+        """Сохранение случая в историческую базу (нечисловые признаки - ValueError/TypeError)."""
+        # Признаки считаются до изменения базы: ошибка в них не должна
+        # рассогласовать базу случаев с матрицей признаков
+        rows = self._case_rows([{"transaction": transaction}])
         try:
+            ts_ns = time.time_ns()
             case = {
-                "id": f"case_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                "timestamp": datetime.now().isoformat(),
+                "id": f"case_{ts_ns}_{next(self._case_counter)}",
+                "timestamp": datetime.fromtimestamp(ts_ns / 1e9).isoformat(),
                 "transaction": transaction,
                 "prediction": result,
                 "feedback": feedback,
@@ -417,22 +758,39 @@ class EnhancedFraudExplainer:
                 "pattern_type": "auto_detected"
             }
             
-            self.similar_cases_db.append(case)
-            
-            # Ограничиваем размер базы
-            if len(self.similar_cases_db) > 1000:
-                self.similar_cases_db = self.similar_cases_db[-1000:]
-            
-            # Сохраняем в файл
-            os.makedirs("data", exist_ok=True)
-            with open("data/historical_cases.json", 'w', encoding='utf-8') as f:
-                json.dump(self.similar_cases_db, f, ensure_ascii=False, indent=2)
+            with self._history_lock:
+                self.similar_cases_db.append(case)
+                
+                # Ограничиваем размер базы
+                n_dropped = max(0, len(self.similar_cases_db) - MAX_HISTORY_CASES)
+                if n_dropped:
+                    self.similar_cases_db = self.similar_cases_db[n_dropped:]
+                self._append_cases([case], n_dropped, rows)
+                
+                # Дописываем случай в файл; файл целиком переписывается только
+                # при переходе со старого формата или когда он вдвое больше лимита
+                CASES_FILE.parent.mkdir(parents=True, exist_ok=True)
+                if not CASES_FILE.exists() or self._cases_file_lines >= 2 * MAX_HISTORY_CASES:
+                    self._compact_cases_file()
+                else:
+                    with open(CASES_FILE, 'a', encoding='utf-8') as f:
+                        f.write(_dumps_line(case) + "\n")
+                    self._cases_file_lines += 1
                 
             logger.info(f"Случай {case['id']} сохранен в историческую базу")
             
         except Exception as e:
             logger.error(f"Ошибка сохранения случая: {e}")
 
+    def _compact_cases_file(self):
+        """Перезапись CASES_FILE текущей базой случаев."""
+        tmp_file = CASES_FILE.with_suffix(CASES_FILE.suffix + ".tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for case in self.similar_cases_db:
+                f.write(_dumps_line(case) + "\n")
+        os.replace(tmp_file, CASES_FILE)
+        self._cases_file_lines = len(self.similar_cases_db)
+
 # Глобальный экземпляр
 enhanced_explainer = EnhancedFraudExplainer()
 
@@ -445,6 +803,10 @@ def find_similar_transactions(transaction: Dict[str, Any], top_k: int = 3) -> Li
     """Поиск похожих транзакций."""
     return enhanced_explainer.find_similar_cases(transaction, top_k)
 
+def find_similar_transactions_batch(transactions: List[Dict[str, Any]], top_k: int = 3) -> List[List[Dict]]:
+    """Поиск похожих транзакций для пакета транзакций."""
+    return enhanced_explainer.find_similar_cases_batch(transactions, top_k)
+
 def analyze_transaction_anomalies(transaction: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
     """Анализ аномалий в транзакции."""
     return enhanced_explainer.analyze_anomalies(transaction, result)
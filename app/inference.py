@@ -7,20 +7,41 @@
 - Интерпретации результатов
 """
 
+import bisect
 import joblib
 import numpy as np
 import os
 import logging
-from typing import Dict, Tuple, Optional
-from .preprocess import DataPreprocessor
+import threading
+from functools import lru_cache
+from scipy.special import expit
+from typing import Dict, List, Tuple, Optional, Sequence, Union
+from .preprocess import DataPreprocessor, FEATURE_NAMES
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Загрузка массивов модели и скейлера через mmap (joblib mmap_mode='r'): страницы файла
+# делятся между процессами через page cache. Включается явно - файл модели нельзя
+# перезаписывать на месте, пока он отображен в память работающих процессов
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "0").lower() in ("1", "true", "yes")
+
+# Размер кэша вероятностей по нормализованному вектору признаков (0 - без кэша)
+PROBABILITY_CACHE_SIZE = int(os.environ.get("PROBABILITY_CACHE_SIZE", 4096))
+
+# Скейлер и модель одним файлом; при его наличии model.pkl и scaler.pkl не читаются
+PIPELINE_FILE = "pipeline.pkl"
+
+# Границы уровней риска по вероятности мошенничества и их названия
+_RISK_BOUNDS = (0.1, 0.3, 0.7, 0.9)
+_RISK_LEVELS = ("Очень низкий", "Низкий", "Средний", "Высокий", "Очень высокий")
+
 class FraudDetectionModel:
     """Класс для загрузки модели и выполнения предсказаний."""
     
+    __slots__ = ('model_dir', 'model', 'scaler', 'metrics', 'preprocessor', '_probability_cache', '_linear')
+    
     def __init__(self, model_dir: str = None):
         """
         Инициализация модели.
@@ -29,9 +50,9 @@ class FraudDetectionModel:
             model_dir: Путь к директории с моделью
         """
         if model_dir is None:
-            # Путь по умолчанию относительно текущего файла
+            # Путь из MODEL_DIR или по умолчанию относительно текущего файла
             base_dir = os.path.dirname(os.path.abspath(__file__))
-            self.model_dir = os.path.join(base_dir, '..', '..', 'model')
+            self.model_dir = os.environ.get("MODEL_DIR") or os.path.join(base_dir, '..', '..', 'model')
         else:
             self.model_dir = model_dir
         
@@ -39,6 +60,10 @@ class FraudDetectionModel:
         self.scaler = None
         self.metrics = None
         self.preprocessor = None
+        # (coef, intercept) бинарной линейной модели для прямого расчета вероятностей
+        self._linear = None
+        # Повторные транзакции (ретраи, повторные проверки) не пересчитываются моделью
+        self._probability_cache = lru_cache(maxsize=PROBABILITY_CACHE_SIZE)(self._predict_probability)
         
         # Автоматическая загрузка модели при инициализации
         self.load_model()
@@ -46,32 +71,55 @@ class FraudDetectionModel:
     def load_model(self) -> None:
         """Загрузка модели, скейлера и метрик."""
         try:
-            # Пути к файлам
-            model_path = os.path.join(self.model_dir, "model.pkl")
-            scaler_path = os.path.join(self.model_dir, "scaler.pkl")
-            metrics_path = os.path.join(self.model_dir, "metrics.pkl")
-            
-            # Проверка существования файлов
-            if not os.path.exists(model_path):
-                raise FileNotFoundError(f"Модель не найдена: {model_path}")
-            if not os.path.exists(scaler_path):
-                raise FileNotFoundError(f"Скейлер не найден: {scaler_path}")
+            # Одно чтение каталога вместо проверки каждого файла отдельным stat
+            try:
+                with os.scandir(self.model_dir) as it:
+                    entries = {entry.name: entry.path for entry in it}
+            except FileNotFoundError:
+                entries = {}
             
-            # Загрузка модели
-            self.model = joblib.load(model_path)
-            logger.info(f"Модель загружена из {model_path}")
+            mmap_mode = 'r' if MODEL_MMAP else None
             
-            # Загрузка скейлера
-            self.scaler = joblib.load(scaler_path)
-            logger.info(f"Скейлер загружен из {scaler_path}")
+            pipeline_path = entries.get(PIPELINE_FILE)
+            if pipeline_path:
+                # Скейлер и модель одним файлом (см. save_pipeline)
+                self.scaler, self.model = self._split_pipeline(joblib.load(pipeline_path, mmap_mode=mmap_mode))
+                logger.info("Скейлер и модель загружены из %s", pipeline_path)
+            else:
+                # Проверка существования файлов
+                if "model.pkl" not in entries:
+                    raise FileNotFoundError(f"Модель не найдена: {os.path.join(self.model_dir, 'model.pkl')}")
+                if "scaler.pkl" not in entries:
+                    raise FileNotFoundError(f"Скейлер не найден: {os.path.join(self.model_dir, 'scaler.pkl')}")
+                model_path = entries["model.pkl"]
+                scaler_path = entries["scaler.pkl"]
+                
+                # Загрузка модели
+                self.model = joblib.load(model_path, mmap_mode=mmap_mode)
+                logger.info("Модель загружена из %s", model_path)
+                
+                # Загрузка скейлера
+                self.scaler = joblib.load(scaler_path, mmap_mode=mmap_mode)
+                logger.info("Скейлер загружен из %s", scaler_path)
             
             # Загрузка метрик (опционально)
-            if os.path.exists(metrics_path):
+            metrics_path = entries.get("metrics.pkl")
+            if metrics_path:
                 self.metrics = joblib.load(metrics_path)
-                logger.info(f"Метрики загружены из {metrics_path}")
+                logger.info("Метрики загружены из %s", metrics_path)
             
-            # Инициализация препроцессора
-            self.preprocessor = DataPreprocessor(scaler_path)
+            # Инициализация препроцессора с уже загруженным скейлером
+            self.preprocessor = DataPreprocessor()
+            self.preprocessor.set_scaler(self.scaler)
+            self._probability_cache.cache_clear()
+            self._linear = self._linear_params()
+            
+            # Первый вызов predict_proba инициализирует BLAS и внутренние буферы sklearn;
+            # делаем его при загрузке, а не в первом запросе
+            try:
+                self.model.predict_proba(np.zeros((1, len(FEATURE_NAMES))))
+            except Exception as e:
+                logger.warning("Не удалось прогреть модель: %s", e)
             
             logger.info("Модель успешно инициализирована")
             
@@ -79,6 +127,25 @@ class FraudDetectionModel:
             logger.error(f"Ошибка загрузки модели: {e}")
             raise
     
+    @staticmethod
+    def _split_pipeline(pipeline) -> Tuple[object, object]:
+        """
+        Разделение Pipeline([('scaler', ...), ('clf', ...)]) на скейлер и модель.
+        
+        Шаги используются по отдельности: нормализация идет через препроцессор,
+        а вероятности - через прямой расчет по коэффициентам модели.
+        
+        Args:
+            pipeline: Загруженный sklearn Pipeline
+            
+        Returns:
+            Tuple[object, object]: (скейлер, модель)
+        """
+        steps = getattr(pipeline, 'steps', None)
+        if steps is None or len(steps) != 2:
+            raise ValueError(f"{PIPELINE_FILE} должен содержать Pipeline из двух шагов: скейлер и модель")
+        return steps[0][1], steps[1][1]
+    
     def predict_fraud_probability(self, transaction_data: Dict) -> float:
         """
         Предсказание вероятности мошенничества.
@@ -95,18 +162,105 @@ class FraudDetectionModel:
         try:
             # Предобработка данных
             features = self.preprocessor.prepare_features(transaction_data)
-            
-            # Предсказание вероятности
-            probability = self.model.predict_proba(features)[0, 1]
-            
-            logger.info(f"Предсказание выполнено. Вероятность мошенничества: {probability:.4f}")
-            
-            return float(probability)
+            return self._predict_features(features)
             
         except Exception as e:
             logger.error(f"Ошибка предсказания: {e}")
             raise
     
+    def predict_from_array(self, values: np.ndarray) -> float:
+        """
+        Предсказание вероятности по массиву признаков (быстрый путь без словаря).
+        
+        Значения не валидируются: вызывающий код передает уже проверенные числа.
+        
+        Args:
+            values: 30 значений в порядке FEATURE_NAMES (Time, V1-V28, Amount)
+            
+        Returns:
+            float: Вероятность мошенничества (0-1)
+        """
+        return self._predict_features(self.preprocessor.prepare_array_features(values))
+    
+    def _predict_features(self, features: np.ndarray) -> float:
+        """
+        Вероятность мошенничества по подготовленным признакам.
+        
+        Args:
+            features: Нормализованные признаки, форма (1, 30)
+            
+        Returns:
+            float: Вероятность мошенничества (0-1)
+        """
+        if self.model is None:
+            raise ValueError("Модель не загружена")
+        
+        # Предсказание вероятности (ключ кэша - точные байты вектора признаков)
+        probability = self._probability_cache(features.tobytes())
+        
+        logger.info("Предсказание выполнено. Вероятность мошенничества: %.4f", probability)
+        
+        return probability
+    
+    def _linear_params(self) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Параметры бинарной линейной модели (LogisticRegression) для расчета без predict_proba.
+        
+        Прямой расчет expit(X @ coef + intercept) включается, только если он совпадает
+        с predict_proba модели на контрольных точках.
+        
+        Returns:
+            Optional[Tuple[np.ndarray, float]]: (coef, intercept) или None
+        """
+        coef = getattr(self.model, 'coef_', None)
+        intercept = getattr(self.model, 'intercept_', None)
+        classes = getattr(self.model, 'classes_', None)
+        n_features = len(FEATURE_NAMES)
+        if coef is None or intercept is None or classes is None or len(classes) != 2 \
+                or np.shape(coef) != (1, n_features) or np.size(intercept) != 1:
+            return None
+        
+        try:
+            params = (np.ascontiguousarray(coef, dtype=np.float64).ravel(), float(np.ravel(intercept)[0]))
+            probe = np.random.default_rng(0).normal(0.0, 3.0, size=(64, n_features))
+            expected = self.model.predict_proba(probe)[:, 1]
+            if not np.allclose(expit(probe @ params[0] + params[1]), expected, rtol=0, atol=1e-12):
+                return None
+        except Exception as e:
+            logger.warning("Прямой расчет вероятностей недоступен: %s", e)
+            return None
+        
+        logger.info("Вероятности рассчитываются напрямую по коэффициентам линейной модели")
+        return params
+    
+    def _fraud_probabilities(self, features: np.ndarray) -> np.ndarray:
+        """
+        Вероятности мошенничества для матрицы нормализованных признаков.
+        
+        Args:
+            features: Нормализованные признаки, форма (n, 30)
+            
+        Returns:
+            np.ndarray: Вероятности класса "мошенничество", форма (n,)
+        """
+        if self._linear is not None:
+            coef, intercept = self._linear
+            return expit(features @ coef + intercept)
+        return self.model.predict_proba(features)[:, 1]
+    
+    def _predict_probability(self, feature_bytes: bytes) -> float:
+        """
+        Вероятность мошенничества по нормализованным признакам.
+        
+        Args:
+            feature_bytes: Байты float64 вектора признаков (1, 30)
+            
+        Returns:
+            float: Вероятность мошенничества (0-1)
+        """
+        features = np.frombuffer(feature_bytes, dtype=np.float64).reshape(1, -1)
+        return float(self._fraud_probabilities(features)[0])
+    
     def predict_fraud_class(self, transaction_data: Dict, threshold: float = 0.5) -> bool:
         """
         Предсказание класса (мошенничество/норма).
@@ -121,60 +275,39 @@ class FraudDetectionModel:
         probability = self.predict_fraud_probability(transaction_data)
         return probability >= threshold
     
-    def predict_with_details(self, transaction_data: Dict, threshold: float = 0.5) -> Dict:
+    def predict_with_details(self, transaction_data: Dict, threshold: float = 0.5,
+                             validated: bool = False) -> Dict:
         """
         Полное предсказание с деталями.
         
         Args:
             transaction_data: Данные транзакции
             threshold: Порог для классификации
+            validated: Данные уже проверены validate_transaction_data
             
         Returns:
             Dict: Детальный результат предсказания
         """
         try:
-            # Валидация входных данных
-            is_valid, error_msg = self.preprocessor.validate_transaction_data(transaction_data)
-            if not is_valid:
-                return {
-                    "error": error_msg,
-                    "fraud_score": None,
-                    "is_fraud": None,
-                    "confidence": None
-                }
-            
-            # Предсказание
-            probability = self.predict_fraud_probability(transaction_data)
-            is_fraud = probability >= threshold
-            
-            # Расчет уверенности
-            confidence = max(probability, 1 - probability)
+            # Валидация входных данных (если ее не выполнил вызывающий код)
+            if not validated:
+                is_valid, error_msg = self.preprocessor.validate_transaction_data(transaction_data)
+                if not is_valid:
+                    return {
+                        "error": error_msg,
+                        "fraud_score": None,
+                        "is_fraud": None,
+                        "confidence": None
+                    }
             
-            # Интерпретация риска
-            if probability < 0.1:
-                risk_level = "Очень низкий"
-            elif probability < 0.3:
-                risk_level = "Низкий"
-            elif probability < 0.7:
-                risk_level = "Средний"
-            elif probability < 0.9:
-                risk_level = "Высокий"
-            else:
-                risk_level = "Очень высокий"
-            
-            result = {
-                "fraud_score": round(probability, 4),
-                "is_fraud": is_fraud,
-                "confidence": round(confidence, 4),
-                "risk_level": risk_level,
-                "threshold": threshold,
-                "model_info": {
-                    "model_name": self.metrics.get("model_name", "Unknown") if self.metrics else "Unknown",
-                    "model_auc": self.metrics.get("roc_auc", "Unknown") if self.metrics else "Unknown"
-                }
-            }
+            # Предсказание; данные уже проверены, повторная валидация не нужна
+            features = self.preprocessor.prepare_validated_features(transaction_data)
+            probability = self._predict_features(features)
+            result = self._build_result(probability, threshold)
             
-            logger.info(f"Детальное предсказание: {result}")
+            # Полный результат в лог только на уровне DEBUG: его строковое представление дорогое
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Детальное предсказание: %s", result)
             
             return result
             
@@ -187,32 +320,117 @@ class FraudDetectionModel:
                 "confidence": None
             }
     
-    def batch_predict(self, transactions: list, threshold: float = 0.5) -> list:
+    def predict_array_with_details(self, values: np.ndarray, threshold: float = 0.5) -> Dict:
+        """
+        Полное предсказание с деталями по массиву признаков (без словаря транзакции).
+        
+        Значения не валидируются: вызывающий код передает уже проверенные числа.
+        
+        Args:
+            values: 30 значений в порядке FEATURE_NAMES (Time, V1-V28, Amount)
+            threshold: Порог для классификации
+            
+        Returns:
+            Dict: Детальный результат предсказания
+        """
+        return self._build_result(self.predict_from_array(values), threshold)
+    
+    def _build_result(self, probability: float, threshold: float,
+                      risk_level: Optional[str] = None) -> Dict:
+        """
+        Формирование результата предсказания по вероятности мошенничества.
+        
+        Args:
+            probability: Вероятность мошенничества
+            threshold: Порог для классификации
+            risk_level: Уровень риска, если уже рассчитан (пакетный режим)
+            
+        Returns:
+            Dict: Детальный результат предсказания
+        """
+        is_fraud = probability >= threshold
+        
+        # Расчет уверенности
+        confidence = max(probability, 1 - probability)
+        
+        # Интерпретация риска
+        if risk_level is None:
+            risk_level = _RISK_LEVELS[bisect.bisect_right(_RISK_BOUNDS, probability)]
+        
+        return {
+            "fraud_score": round(probability, 4),
+            "is_fraud": is_fraud,
+            "confidence": round(confidence, 4),
+            "risk_level": risk_level,
+            "threshold": threshold,
+            "model_info": {
+                "model_name": self.metrics.get("model_name", "Unknown") if self.metrics else "Unknown",
+                "model_auc": self.metrics.get("roc_auc", "Unknown") if self.metrics else "Unknown"
+            }
+        }
+    
+    def batch_predict(self, transactions: list,
+                      threshold: Union[float, Sequence[float]] = 0.5) -> list:
         """
         Пакетное предсказание для нескольких транзакций.
         
         Args:
             transactions: Список транзакций
-            threshold: Порог для классификации
+            threshold: Порог для классификации (общий или отдельный для каждой транзакции)
             
         Returns:
             list: Список результатов предсказаний
         """
-        results = []
+        if isinstance(threshold, (int, float)):
+            thresholds = [threshold] * len(transactions)
+        else:
+            thresholds = list(threshold)
+        
+        results: List[Optional[Dict]] = [None] * len(transactions)
+        valid_indices = []
         
+        # Валидация каждой транзакции; ошибки не прерывают обработку пакета
         for i, transaction in enumerate(transactions):
             try:
-                result = self.predict_with_details(transaction, threshold)
-                result["transaction_id"] = i
-                results.append(result)
+                is_valid, error_msg = self.preprocessor.validate_transaction_data(transaction)
             except Exception as e:
                 logger.error(f"Ошибка предсказания для транзакции {i}: {e}")
-                results.append({
+                is_valid, error_msg = False, str(e)
+            
+            if is_valid:
+                valid_indices.append(i)
+            else:
+                results[i] = {
                     "transaction_id": i,
-                    "error": str(e),
+                    "error": error_msg,
                     "fraud_score": None,
-                    "is_fraud": None
-                })
+                    "is_fraud": None,
+                    "confidence": None
+                }
+        
+        # Одна матрица признаков и один вызов модели на все валидные транзакции
+        if valid_indices:
+            try:
+                features = self.preprocessor.prepare_batch_features(
+                    [transactions[i] for i in valid_indices]
+                )
+                probabilities = self._fraud_probabilities(features)
+                # Уровни риска всего пакета одним вызовом
+                risk_buckets = np.digitize(probabilities, _RISK_BOUNDS).tolist()
+                
+                for i, probability, bucket in zip(valid_indices, probabilities.tolist(), risk_buckets):
+                    result = self._build_result(probability, thresholds[i], _RISK_LEVELS[bucket])
+                    result["transaction_id"] = i
+                    results[i] = result
+                    
+            except Exception as e:
+                # Ошибка одной транзакции не должна попасть в результаты остальных:
+                # пакет пересчитывается по одной транзакции
+                logger.error(f"Ошибка пакетного предсказания: {e}")
+                for i in valid_indices:
+                    result = self.predict_with_details(transactions[i], thresholds[i], validated=True)
+                    result["transaction_id"] = i
+                    results[i] = result
         
         return results
     
@@ -241,6 +459,7 @@ class FraudDetectionModel:
 
 # Глобальная переменная для хранения модели (синглтон)
 _global_model = None
+_global_model_lock = threading.Lock()
 
 def get_model(model_dir: str = "../model") -> FraudDetectionModel:
     """
@@ -254,11 +473,35 @@ def get_model(model_dir: str = "../model") -> FraudDetectionModel:
     """
     global _global_model
     
+    # Двойная проверка: одновременные первые запросы загружают модель только один раз
     if _global_model is None:
-        _global_model = FraudDetectionModel(model_dir)
+        with _global_model_lock:
+            if _global_model is None:
+                _global_model = FraudDetectionModel(model_dir)
     
     return _global_model
 
+def save_pipeline(model_dir: str) -> str:
+    """
+    Объединение model.pkl и scaler.pkl в один pipeline.pkl.
+    
+    Файл сохраняется без сжатия, чтобы его можно было загружать через mmap.
+    
+    Args:
+        model_dir: Путь к директории с моделью
+        
+    Returns:
+        str: Путь к сохраненному файлу
+    """
+    from sklearn.pipeline import Pipeline
+    
+    model = joblib.load(os.path.join(model_dir, 'model.pkl'))
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+    pipeline_path = os.path.join(model_dir, PIPELINE_FILE)
+    joblib.dump(Pipeline([('scaler', scaler), ('clf', model)]), pipeline_path, compress=0)
+    logger.info("Pipeline сохранен в %s", pipeline_path)
+    return pipeline_path
+
 def predict_fraud(transaction_data: Dict, threshold: float = 0.5) -> Dict:
     """
     Быстрая функция для предсказания мошенничества.
@@ -285,9 +528,9 @@ def validate_and_predict(transaction_data: Dict, threshold: float = 0.5) -> Dict
         Dict: Результат с валидацией и предсказанием
     """
     try:
-        # Создаем временный препроцессор для валидации
-        preprocessor = DataPreprocessor()
-        is_valid, error_msg = preprocessor.validate_transaction_data(transaction_data)
+        # Валидация препроцессором уже загруженной модели
+        model = get_model()
+        is_valid, error_msg = model.preprocessor.validate_transaction_data(transaction_data)
         
         if not is_valid:
             return {
@@ -297,8 +540,8 @@ def validate_and_predict(transaction_data: Dict, threshold: float = 0.5) -> Dict
                 "is_fraud": None
             }
         
-        # Если данные валидны, делаем предсказание
-        result = predict_fraud(transaction_data, threshold)
+        # Если данные валидны, делаем предсказание без повторной валидации
+        result = model.predict_with_details(transaction_data, threshold, validated=True)
         result["valid"] = True
         
         return result
@@ -1,7 +1,7 @@
 import os
 import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -11,11 +11,26 @@ try:
 except Exception as e:
     genai = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def _dumps_compact(obj: Any) -> str:
+        """Компактный JSON для промпта (UTF-8 без экранирования)."""
+        return orjson.dumps(obj).decode()
+else:
+    _json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    _dumps_compact = _json_encoder.encode
+
 _API_KEY = os.environ.get("GEMINI_API_KEY")
 _MODEL = None
+# Настройки генерации создаются один раз вместе с моделью
+_GENERATION_CONFIG = None
 
 def _init_model() -> None:
-    global _MODEL
+    global _MODEL, _GENERATION_CONFIG
     if _MODEL is not None:
         return
 
@@ -32,6 +47,10 @@ def _init_model() -> None:
         # Используем настройки из .env или дефолтные
         model_name = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash-exp")
         _MODEL = genai.GenerativeModel(model_name)
+        _GENERATION_CONFIG = genai.types.GenerationConfig(
+            temperature=float(os.environ.get("GEMINI_TEMPERATURE", "0.3")),
+            max_output_tokens=int(os.environ.get("GEMINI_MAX_TOKENS", "500")),
+        )
         logger.info(f"Gemini модель инициализирована ({model_name})")
     except Exception as e:
         logger.error(f"Ошибка инициализации Gemini: {e}")
@@ -44,46 +63,23 @@ def llm_available() -> bool:
     return _MODEL is not None
 
 
-def explain_transaction(transaction: Dict[str, Any], result: Dict[str, Any]) -> str:
-    """
-    Сгенерировать детальное объяснение предсказания для транзакции.
+_LLM_UNAVAILABLE_MESSAGE = "LLM недоступен: установите google-generativeai и задайте GEMINI_API_KEY в .env файле."
 
-    Args:
-        transaction: входные признаки транзакции (V1..V28, Amount, опц. Time)
-        result: результат предсказания из модели (fraud_score, is_fraud, confidence, risk_level, threshold, model_info)
 
-    Returns:
-        str: детальное текстовое объяснение на русском.
-    """
-    if not llm_available():
-        return "LLM недоступен: установите google-generativeai и задайте GEMINI_API_KEY в .env файле."
-
-    try:
-        score = result.get("fraud_score", 0)
-        is_fraud = result.get("is_fraud", False)
-        confidence = result.get("confidence", 0)
-        risk_level = result.get("risk_level", "Неизвестно")
-        threshold = result.get("threshold", 0.5)
-        model_info = result.get("model_info", {})
-        amount = transaction.get("Amount", 0)
-
-        # Получаем настройки генерации из .env
-        temperature = float(os.environ.get("GEMINI_TEMPERATURE", "0.3"))
-        max_tokens = int(os.environ.get("GEMINI_MAX_TOKENS", "500"))
-
-        prompt = f"""Ты эксперт-аналитик по финансовому мошенничеству. Проанализируй транзакцию и объясни решение модели машинного обучения.
+# Шаблон промпта: постоянный текст задается один раз, на каждый вызов подставляются только значения
+_PROMPT_TEMPLATE = """Ты эксперт-аналитик по финансовому мошенничеству. Проанализируй транзакцию и объясни решение модели машинного обучения.
 
 ДАННЫЕ ТРАНЗАКЦИИ:
 • Сумма: {amount:.2f}
-• Вероятность мошенничества: {score:.4f} ({score*100:.2f}%)
+• Вероятность мошенничества: {score:.4f} ({score_pct:.2f}%)
 • Порог классификации: {threshold}
-• Итоговое решение: {'🚨 МОШЕННИЧЕСТВО' if is_fraud else '✅ ЛЕГИТИМНАЯ ТРАНЗАКЦИЯ'}
+• Итоговое решение: {decision}
 • Уровень риска: {risk_level}
-• Уверенность модели: {confidence:.4f} ({confidence*100:.2f}%)
-• Модель: {model_info.get('model_name', 'Неизвестно')} (AUC: {model_info.get('model_auc', 'N/A')})
+• Уверенность модели: {confidence:.4f} ({confidence_pct:.2f}%)
+• Модель: {model_name} (AUC: {model_auc})
 
 ПРИЗНАКИ ТРАНЗАКЦИИ (PCA-преобразованные):
-{json.dumps({k: round(v, 4) if isinstance(v, (int, float)) else v for k, v in transaction.items()}, ensure_ascii=False, indent=2)}
+{features_json}
 
 ЗАДАЧА:
 Проанализируй эту транзакцию и дай профессиональное объяснение в следующем формате:
@@ -105,14 +101,73 @@ def explain_transaction(transaction: Dict[str, Any], result: Dict[str, Any]) ->
 
 Пиши профессионально, но понятно. Избегай технического жаргона. Фокусируйся на практических выводах."""
 
-        generation_config = genai.types.GenerationConfig(
-            temperature=temperature,
-            max_output_tokens=max_tokens,
-        )
 
-        resp = _MODEL.generate_content(prompt, generation_config=generation_config)
+def _build_explanation_prompt(transaction: Dict[str, Any], result: Dict[str, Any]) -> str:
+    """Построение промпта для объяснения предсказания."""
+    score = result.get("fraud_score", 0)
+    confidence = result.get("confidence", 0)
+    model_info = result.get("model_info", {})
+
+    return _PROMPT_TEMPLATE.format(
+        amount=transaction.get("Amount", 0),
+        score=score,
+        score_pct=score * 100,
+        threshold=result.get("threshold", 0.5),
+        decision='🚨 МОШЕННИЧЕСТВО' if result.get("is_fraud", False) else '✅ ЛЕГИТИМНАЯ ТРАНЗАКЦИЯ',
+        risk_level=result.get("risk_level", "Неизвестно"),
+        confidence=confidence,
+        confidence_pct=confidence * 100,
+        model_name=model_info.get('model_name', 'Неизвестно'),
+        model_auc=model_info.get('model_auc', 'N/A'),
+        features_json=_dumps_compact({k: round(v, 4) if isinstance(v, (int, float)) else v for k, v in transaction.items()}),
+    )
+
+
+def explain_transaction(transaction: Dict[str, Any], result: Dict[str, Any]) -> str:
+    """
+    Сгенерировать детальное объяснение предсказания для транзакции.
+
+    Args:
+        transaction: входные признаки транзакции (V1..V28, Amount, опц. Time)
+        result: результат предсказания из модели (fraud_score, is_fraud, confidence, risk_level, threshold, model_info)
+
+    Returns:
+        str: детальное текстовое объяснение на русском.
+    """
+    if not llm_available():
+        return _LLM_UNAVAILABLE_MESSAGE
+
+    try:
+        prompt = _build_explanation_prompt(transaction, result)
+        resp = _MODEL.generate_content(prompt, generation_config=_GENERATION_CONFIG)
         return (resp.text or "Не удалось получить ответ от модели.").strip()
         
     except Exception as e:
         logger.error(f"Ошибка генерации объяснения: {e}")
-        return f"Ошибка LLM при формировании объяснения: {str(e)}"
\ No newline at end of file
+        return f"Ошибка LLM при формировании объяснения: {str(e)}"
+
+
+def explain_transaction_stream(transaction: Dict[str, Any], result: Dict[str, Any]) -> Iterator[str]:
+    """
+    Потоковая генерация объяснения: фрагменты текста возвращаются по мере получения от Gemini.
+
+    Args:
+        transaction: входные признаки транзакции (V1..V28, Amount, опц. Time)
+        result: результат предсказания из модели
+
+    Yields:
+        str: очередной фрагмент объяснения.
+    """
+    if not llm_available():
+        yield _LLM_UNAVAILABLE_MESSAGE
+        return
+
+    try:
+        prompt = _build_explanation_prompt(transaction, result)
+        for chunk in _MODEL.generate_content(prompt, generation_config=_GENERATION_CONFIG, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    except Exception as e:
+        logger.error(f"Ошибка потоковой генерации объяснения: {e}")
+        yield f"Ошибка LLM при формировании объяснения: {str(e)}"
\ No newline at end of file
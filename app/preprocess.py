@@ -12,6 +12,9 @@ import numpy as np
 from sklearn.preprocessing import StandardScaler
 import joblib
 import os
+import math
+import operator
+import threading
 from typing import Dict, List, Union, Tuple
 import logging
 
@@ -19,9 +22,22 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Порядок признаков, на котором обучены скейлер и модель
+FEATURE_NAMES = ('Time',) + tuple(f'V{i}' for i in range(1, 29)) + ('Amount',)
+
+# Признаки, обязательные во входной транзакции (Time необязателен)
+_REQUIRED_FEATURES = FEATURE_NAMES[1:]
+_REQUIRED_FEATURE_SET = frozenset(_REQUIRED_FEATURES)
+
+# Извлечение признаков из словаря транзакции одним вызовом на C
+_get_features = operator.itemgetter(*FEATURE_NAMES)
+_get_model_features = operator.itemgetter(*FEATURE_NAMES[1:])
+
 class DataPreprocessor:
     """Класс для предобработки данных транзакций."""
     
+    __slots__ = ('scaler', 'feature_names', '_batch_buffers', '_mean', '_inv_scale')
+    
     def __init__(self, scaler_path: str = None):
         """
         Инициализация препроцессора.
@@ -31,6 +47,11 @@ class DataPreprocessor:
         """
         self.scaler = None
         self.feature_names = None
+        # Параметры скейлера для нормализации без вызова transform: (X - mean) * inv_scale
+        self._mean = None
+        self._inv_scale = None
+        # Переиспользуемые буферы матрицы признаков (свой для каждого потока)
+        self._batch_buffers = threading.local()
         
         if scaler_path and os.path.exists(scaler_path):
             self.load_scaler(scaler_path)
@@ -43,12 +64,31 @@ class DataPreprocessor:
             scaler_path: Путь к файлу скейлера
         """
         try:
-            self.scaler = joblib.load(scaler_path)
-            logger.info(f"Скейлер загружен из {scaler_path}")
+            self.set_scaler(joblib.load(scaler_path))
+            logger.info("Скейлер загружен из %s", scaler_path)
         except Exception as e:
             logger.error(f"Ошибка загрузки скейлера: {e}")
             raise
     
+    def set_scaler(self, scaler: StandardScaler) -> None:
+        """
+        Установка уже загруженного скейлера.
+        
+        Args:
+            scaler: Обученный скейлер (для StandardScaler нормализация выполняется без transform)
+        """
+        self.scaler = scaler
+        self._mean = None
+        self._inv_scale = None
+        if not isinstance(scaler, StandardScaler):
+            # Другие скейлеры (MinMaxScaler, RobustScaler, ...) нормализуются через transform
+            return
+        n_features = len(FEATURE_NAMES)
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        self._mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        self._inv_scale = np.ones(n_features) if scale is None else 1.0 / np.asarray(scale, dtype=np.float64)
+    
     def validate_transaction_data(self, data: Dict) -> Tuple[bool, str]:
         """
         Валидация данных транзакции.
@@ -59,34 +99,54 @@ class DataPreprocessor:
         Returns:
             Tuple[bool, str]: (валидность, сообщение об ошибке)
         """
-        required_features = [
-            'V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9', 'V10',
-            'V11', 'V12', 'V13', 'V14', 'V15', 'V16', 'V17', 'V18', 'V19', 'V20',
-            'V21', 'V22', 'V23', 'V24', 'V25', 'V26', 'V27', 'V28', 'Amount'
-        ]
-        
-        # Проверка наличия всех необходимых признаков
-        missing_features = [f for f in required_features if f not in data]
-        if missing_features:
+        # Проверка наличия всех необходимых признаков; список в порядке признаков
+        # строится только для сообщения об ошибке
+        if _REQUIRED_FEATURE_SET.difference(data):
+            missing_features = [f for f in _REQUIRED_FEATURES if f not in data]
             return False, f"Отсутствуют признаки: {missing_features}"
         
-        # Проверка типов данных
-        for feature in required_features:
+        # Проверка типов данных: одно преобразование всех признаков, обход по
+        # признакам только для поиска ошибочного
+        try:
+            values = tuple(map(float, _get_model_features(data)))
+        except (ValueError, TypeError):
+            return False, self._first_invalid_feature(data)
+        
+        # Каждый признак проверяется отдельно: сумма конечных значений может переполниться
+        if not all(map(math.isfinite, values)):
+            return False, self._first_invalid_feature(data)
+        
+        # Time необязателен, но если указан, попадает в матрицу признаков
+        if 'Time' in data:
             try:
-                float(data[feature])
+                time_value = float(data['Time'])
             except (ValueError, TypeError):
-                return False, f"Признак {feature} должен быть числом"
+                return False, "Признак Time должен быть числом"
+            if not math.isfinite(time_value):
+                return False, "Признак Time должен быть конечным числом"
         
         # Проверка разумных диапазонов для Amount
-        amount = float(data['Amount'])
+        amount = values[-1]
         if amount < 0:
             return False, "Сумма транзакции не может быть отрицательной"
         
         if amount > 100000:  # Разумный верхний предел
-            logger.warning(f"Очень большая сумма транзакции: {amount}")
+            logger.warning("Очень большая сумма транзакции: %s", amount)
         
         return True, "OK"
     
+    @staticmethod
+    def _first_invalid_feature(data: Dict) -> str:
+        """Сообщение об ошибке для первого нечислового или бесконечного признака."""
+        for feature in _REQUIRED_FEATURES:
+            try:
+                value = float(data[feature])
+            except (ValueError, TypeError):
+                return f"Признак {feature} должен быть числом"
+            if not math.isfinite(value):
+                return f"Признак {feature} должен быть конечным числом"
+        return "Признаки должны быть конечными числами"
+    
     def prepare_features(self, data: Dict) -> np.ndarray:
         """
         Подготовка признаков для модели.
@@ -102,32 +162,103 @@ class DataPreprocessor:
         if not is_valid:
             raise ValueError(f"Ошибка валидации: {error_msg}")
         
-        # Создание DataFrame
-        feature_names = [
-            'Time', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9', 'V10',
-            'V11', 'V12', 'V13', 'V14', 'V15', 'V16', 'V17', 'V18', 'V19', 'V20',
-            'V21', 'V22', 'V23', 'V24', 'V25', 'V26', 'V27', 'V28', 'Amount'
-        ]
+        return self.prepare_validated_features(data)
+    
+    def prepare_validated_features(self, data: Dict) -> np.ndarray:
+        """
+        Подготовка признаков транзакции, уже прошедшей validate_transaction_data.
         
+        Args:
+            data: Словарь с данными транзакции
+            
+        Returns:
+            np.ndarray: Нормализованные признаки, форма (1, 30)
+        """
         # Добавляем Time = 0 если не указано (для совместимости с обученной моделью)
         if 'Time' not in data:
             data['Time'] = 0
         
-        # Создаем массив признаков в правильном порядке
-        features = []
-        for feature in feature_names:
-            features.append(float(data[feature]))
-        
-        features_array = np.array(features).reshape(1, -1)
-        
         # Нормализация с помощью загруженного скейлера
         if self.scaler is None:
             raise ValueError("Скейлер не загружен. Используйте load_scaler()")
         
-        normalized_features = self.scaler.transform(features_array)
+        # Признаки в правильном порядке пишутся в буфер потока (1, 30) без новых массивов;
+        # нормализация возвращает новый массив, поэтому буфер можно переиспользовать
+        features_array = self._get_batch_buffer(1)
+        features_array[0] = _get_features(data)
+        
+        normalized_features = self._normalize(features_array)
         
         return normalized_features
     
+    def prepare_array_features(self, values: np.ndarray) -> np.ndarray:
+        """
+        Подготовка признаков из массива значений без обращений к словарю.
+        
+        Args:
+            values: 30 значений в порядке FEATURE_NAMES (Time, V1-V28, Amount)
+            
+        Returns:
+            np.ndarray: Нормализованные признаки, форма (1, 30)
+        """
+        if self.scaler is None:
+            raise ValueError("Скейлер не загружен. Используйте load_scaler()")
+        
+        features_array = np.asarray(values, dtype=np.float64).reshape(1, -1)
+        if features_array.shape[1] != len(FEATURE_NAMES):
+            raise ValueError(f"Ожидается {len(FEATURE_NAMES)} признаков, получено {features_array.shape[1]}")
+        
+        return self._normalize(features_array)
+    
+    def _normalize(self, features: np.ndarray) -> np.ndarray:
+        """
+        Нормализация как StandardScaler.transform, но без проверок sklearn на каждый вызов.
+        
+        Args:
+            features: Признаки в порядке FEATURE_NAMES, форма (n, 30)
+            
+        Returns:
+            np.ndarray: Новый массив нормализованных признаков
+        """
+        if self._mean is None:
+            # Скейлер не StandardScaler или задан напрямую, а не через set_scaler
+            return self.scaler.transform(features)
+        normalized = np.subtract(features, self._mean)
+        normalized *= self._inv_scale
+        return normalized
+    
+    def _get_batch_buffer(self, n_rows: int) -> np.ndarray:
+        """
+        Буфер матрицы признаков текущего потока на n_rows строк.
+        
+        Буфер увеличивается при необходимости и переиспользуется между вызовами.
+        """
+        buffer = getattr(self._batch_buffers, 'buffer', None)
+        if buffer is None or buffer.shape[0] < n_rows:
+            buffer = np.empty((n_rows, len(FEATURE_NAMES)), dtype=np.float64)
+            self._batch_buffers.buffer = buffer
+        return buffer[:n_rows]
+    
+    def prepare_batch_features(self, transactions: List[Dict]) -> np.ndarray:
+        """
+        Подготовка матрицы признаков для пакета уже провалидированных транзакций.
+        
+        Args:
+            transactions: Список транзакций, прошедших validate_transaction_data
+            
+        Returns:
+            np.ndarray: Нормализованные признаки, форма (n, 30)
+        """
+        if self.scaler is None:
+            raise ValueError("Скейлер не загружен. Используйте load_scaler()")
+        
+        buffer = self._get_batch_buffer(len(transactions))
+        # Time = 0 если не указано (для совместимости с обученной моделью)
+        buffer[:, 0] = [data.get('Time', 0) for data in transactions]
+        buffer[:, 1:] = [_get_model_features(data) for data in transactions]
+        
+        return self._normalize(buffer)
+    
     def create_sample_transaction(self) -> Dict:
         """
         Создание примера транзакции для тестирования.
@@ -168,6 +299,14 @@ class DataPreprocessor:
         }
 
 
+# Типы колонок датасета: float32 вдвое уменьшает память по сравнению с float64
+_CSV_DTYPES = {feature: np.float32 for feature in FEATURE_NAMES}
+_CSV_DTYPES['Class'] = np.int8
+
+# Колонки, обязательные в CSV датасета (порядок — для сообщения об ошибке)
+_CSV_REQUIRED_COLUMNS = ('Class',) + FEATURE_NAMES[1:] + ('Time',)
+_CSV_REQUIRED_COLUMN_SET = frozenset(_CSV_REQUIRED_COLUMNS)
+
 def load_and_preprocess_data(csv_path: str) -> Tuple[np.ndarray, np.ndarray]:
     """
     Загрузка и предобработка данных из CSV файла.
@@ -179,29 +318,29 @@ def load_and_preprocess_data(csv_path: str) -> Tuple[np.ndarray, np.ndarray]:
         Tuple[np.ndarray, np.ndarray]: (признаки, целевая переменная)
     """
     try:
-        # Загрузка данных
-        df = pd.read_csv(csv_path)
-        logger.info(f"Данные загружены из {csv_path}. Размер: {df.shape}")
+        # Загрузка данных сразу в float32 (признаки) и int8 (класс)
+        df = pd.read_csv(csv_path, dtype=_CSV_DTYPES, engine='c')
+        logger.info("Данные загружены из %s. Размер: %s", csv_path, df.shape)
         
         # Проверка наличия необходимых колонок
-        required_columns = ['Class'] + [f'V{i}' for i in range(1, 29)] + ['Amount', 'Time']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
+        if _CSV_REQUIRED_COLUMN_SET.difference(df.columns):
+            missing_columns = [col for col in _CSV_REQUIRED_COLUMNS if col not in df.columns]
             raise ValueError(f"Отсутствуют колонки: {missing_columns}")
         
         # Разделение на признаки и целевую переменную
-        X = df.drop(['Class'], axis=1)
+        X = df.drop(columns=['Class'])
         y = df['Class']
+        del df
         
         # Проверка на пропущенные значения
-        if X.isnull().sum().sum() > 0:
+        if X.isnull().values.any():
             logger.warning("Обнаружены пропущенные значения. Заполняем медианой.")
-            X = X.fillna(X.median())
+            X.fillna(X.median(), inplace=True)
         
-        logger.info(f"Предобработка завершена. Признаки: {X.shape}, Целевая переменная: {y.shape}")
+        logger.info("Предобработка завершена. Признаки: %s, Целевая переменная: %s", X.shape, y.shape)
         
-        return X.values, y.values
+        # Однородный float32 блок отдается без копирования
+        return X.to_numpy(copy=False), y.to_numpy(copy=False)
         
     except Exception as e:
         logger.error(f"Ошибка при загрузке и предобработке данных: {e}")
@@ -224,7 +363,7 @@ def create_scaler_from_data(X: np.ndarray, save_path: str = None) -> StandardSca
     
     if save_path:
         joblib.dump(scaler, save_path)
-        logger.info(f"Скейлер сохранен в {save_path}")
+        logger.info("Скейлер сохранен в %s", save_path)
     
     return scaler
 
@@ -0,0 +1,10 @@
+"""
+WSGI точка входа для production-сервера.
+
+Запуск:
+    gunicorn -c gunicorn.conf.py app.wsgi:app
+"""
+
+from app.api import app
+
+__all__ = ["app"]
@@ -10,27 +10,25 @@ Streamlit Dashboard для системы детекции мошенничес
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import requests
 import json
+import numbers
 import os
 import sys
-import joblib
 from datetime import datetime
 import warnings
 
 warnings.filterwarnings('ignore')
 
-# Добавляем путь для импорта модулей
-sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+# Добавляем путь для импорта модулей (один раз: Streamlit выполняет скрипт заново при
+# каждом взаимодействии в том же процессе, и sys.path рос бы с каждым перезапуском)
+_APP_PATH = os.path.join(os.path.dirname(__file__), 'app')
+if _APP_PATH not in sys.path:
+    sys.path.append(_APP_PATH)
 
 try:
     from app.inference import get_model, FraudDetectionModel
-    from app.preprocess import DataPreprocessor
+    from app.preprocess import DataPreprocessor, FEATURE_NAMES
 except ImportError:
     st.error("Ошибка импорта модулей. Убедитесь, что все файлы находятся в правильных директориях.")
     st.stop()
@@ -82,6 +80,78 @@ st.markdown("""
 # Заголовок
 st.markdown('<h1 class="main-header">🔍 AI Fraud Detection Dashboard</h1>', unsafe_allow_html=True)
 
+# Признаки формы предсказания (V1-V28, Amount) и их значения по умолчанию
+_FORM_FEATURES = list(FEATURE_NAMES[1:])
+_FORM_DEFAULTS = {**dict.fromkeys(_FORM_FEATURES[:-1], 0.0), "Amount": 100.0}
+_FORM_COLUMN_CONFIG = {
+    **{name: st.column_config.NumberColumn(name, format="%.6f", required=True) for name in _FORM_FEATURES[:-1]},
+    "Amount": st.column_config.NumberColumn("Amount", help="Сумма транзакции", min_value=0.0, format="%.2f", required=True)
+}
+
+# Мошенническая транзакция из датасета Credit Card Fraud Detection (Time = 406)
+_FRAUD_EXAMPLE = dict(zip(_FORM_FEATURES, (
+    -2.3122265423263, 1.95199201064158, -1.60985073229769, 3.9979055875468,
+    -0.522187864667764, -1.42654531920595, -2.53738730624579, 1.39165724829804,
+    -2.77008927719433, -2.77227214465915, 3.20203320709635, -2.89990738849473,
+    -0.595221881324605, -4.28925378244217, 0.389724120274487, -1.14074717980657,
+    -2.83005567450437, -0.0168224681808257, 0.416955705037907, 0.126910559061474,
+    0.517232370861764, -0.0350493686052974, -0.465211076182388, 0.320198198514526,
+    0.0445191674731724, 0.177839798284401, 0.261145002567677, -0.143275874698919,
+    0.0
+)))
+
+def set_form_values(values):
+    """
+    Подстановка значений в форму предсказания (колбэк кнопок примеров).
+    
+    Значения хранятся в st.session_state, а новая версия ключа таблицы сбрасывает
+    правки пользователя; колбэк выполняется до перезапуска, отдельный rerun не нужен.
+    """
+    st.session_state.tx_defaults = values
+    st.session_state.tx_editor_version = st.session_state.get("tx_editor_version", 0) + 1
+
+def set_random_form_values():
+    """Случайная транзакция: V1-V28 из N(0, 1), сумма из экспоненциального распределения."""
+    values = dict(zip(_FORM_FEATURES[:-1], np.random.randn(len(_FORM_FEATURES) - 1).round(6).tolist()))
+    values["Amount"] = round(float(np.random.exponential(100.0)), 2)
+    set_form_values(values)
+
+# Файл метрик модели
+METRICS_PATH = os.path.join("model", "metrics.pkl")
+
+# Карточки метрик на странице обзора: (заголовок, ключ в информации о модели)
+_OVERVIEW_CARDS = (
+    ("🎯 Точность", "accuracy"),
+    ("📊 ROC-AUC", "roc_auc"),
+    ("🎯 Precision", "precision"),
+    ("🔍 Recall", "recall")
+)
+
+def _format_metric(value):
+    """Метрика с 4 знаками после запятой или N/A, если ее нет в метриках модели."""
+    return f"{value:.4f}" if isinstance(value, numbers.Real) else "N/A"
+
+# Максимум точек ROC кривой, отправляемых в браузер
+ROC_MAX_POINTS = 1000
+
+def _downsample_roc(fpr, tpr, n_points=ROC_MAX_POINTS):
+    """
+    Прореживание ROC кривой до n_points точек.
+    
+    Точки берутся равномерно по длине кривой: fpr + tpr монотонно растет вдоль
+    ступенчатой ROC кривой, поэтому углы ступеней сохраняются лучше, чем при
+    равномерном выборе по индексу. Первая и последняя точки сохраняются всегда.
+    """
+    fpr = np.asarray(fpr)
+    tpr = np.asarray(tpr)
+    if len(fpr) <= n_points:
+        return fpr, tpr
+    arc = fpr + tpr
+    idx = np.searchsorted(arc, np.linspace(arc[0], arc[-1], n_points))
+    idx = np.unique(np.clip(idx, 0, len(fpr) - 1))
+    idx[0], idx[-1] = 0, len(fpr) - 1
+    return fpr[idx], tpr[idx]
+
 # Функции для работы с моделью
 @st.cache_resource
 def load_fraud_model():
@@ -96,118 +166,105 @@ def load_fraud_model():
     except Exception as e:
         return None, str(e)
 
-@st.cache_data
-def load_model_metrics():
-    """Загрузка метрик модели."""
+def metrics_mtime():
+    """Время изменения файла метрик или None, если файла нет."""
     try:
-        metrics_path = os.path.join("model", "metrics.pkl")
-        if os.path.exists(metrics_path):
-            return joblib.load(metrics_path)
+        return os.path.getmtime(METRICS_PATH)
+    except OSError:
+        return None
+
+@st.cache_data(persist="disk", show_spinner=False)
+def load_model_metrics(mtime):
+    """
+    Загрузка метрик модели.
+    
+    Кэш сохраняется на диск между перезапусками; mtime файла входит в ключ,
+    поэтому обновленный файл метрик перечитывается.
+    """
+    if mtime is None:
         return None
+    try:
+        import joblib
+        return joblib.load(METRICS_PATH)
     except Exception as e:
         st.error(f"Ошибка загрузки метрик: {e}")
         return None
 
+@st.cache_data(show_spinner=False)
+def load_model_info(_model, model_dir):
+    """Информация о модели (модель не хешируется, ключ кэша - каталог модели)."""
+    return _model.get_model_info()
+
+@st.cache_resource
+def http_session():
+    """Общая HTTP-сессия к API: соединения с localhost переиспользуются (keep-alive)."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("http://", adapter)
+    return session
+
+@st.cache_data(ttl=10, show_spinner=False)
 def check_api_status():
-    """Проверка статуса API."""
+    """Проверка статуса API (результат переиспользуется 10 секунд между перезапусками)."""
     try:
-        response = requests.get("http://localhost:5000/health", timeout=5)
+        response = http_session().get("http://localhost:5000/health", timeout=5)
         return response.status_code == 200, response.json() if response.status_code == 200 else None
     except:
         return False, None
 
-# Боковая панель
-st.sidebar.title("🎛️ Навигация")
-
-# Проверка статуса системы
-model, model_error = load_fraud_model()
-api_status, api_info = check_api_status()
-
-# Статус системы в боковой панели
-st.sidebar.markdown("### 📊 Статус системы")
-
-if model is not None:
-    st.sidebar.markdown('<div class="success-card">✅ Модель загружена</div>', unsafe_allow_html=True)
-else:
-    st.sidebar.markdown(f'<div class="danger-card">❌ Модель не загружена<br><small>{model_error}</small></div>', unsafe_allow_html=True)
-
-if api_status:
-    st.sidebar.markdown('<div class="success-card">✅ API доступен</div>', unsafe_allow_html=True)
-else:
-    st.sidebar.markdown('<div class="warning-card">⚠️ API недоступен</div>', unsafe_allow_html=True)
-
-# Выбор страницы
-page = st.sidebar.selectbox(
-    "Выберите страницу:",
-    ["📈 Обзор модели", "🔮 Предсказание", "📊 Визуализация", "🧪 Тестирование API", "ℹ️ Информация"]
-)
-
-# Страница: Обзор модели
-if page == "📈 Обзор модели":
-    st.header("📈 Обзор модели")
-    
-    if model is None:
-        st.error("Модель не загружена. Убедитесь, что модель обучена и сохранена в папке model/")
-        st.info("Для обучения модели запустите: `jupyter notebook notebooks/train_model.ipynb`")
-        st.stop()
-    
-    # Информация о модели
-    model_info = model.get_model_info()
-    
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.markdown(f"""
-        <div class="metric-card">
-            <h3>🎯 Точность</h3>
-            <h2>{model_info.get('accuracy', 'N/A'):.4f}</h2>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown(f"""
-        <div class="metric-card">
-            <h3>📊 ROC-AUC</h3>
-            <h2>{model_info.get('roc_auc', 'N/A'):.4f}</h2>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown(f"""
-        <div class="metric-card">
-            <h3>🎯 Precision</h3>
-            <h2>{model_info.get('precision', 'N/A'):.4f}</h2>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col4:
-        st.markdown(f"""
-        <div class="metric-card">
-            <h3>🔍 Recall</h3>
-            <h2>{model_info.get('recall', 'N/A'):.4f}</h2>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    # Дополнительная информация
-    st.subheader("🔧 Детали модели")
-    
-    col1, col2 = st.columns(2)
+def gauge_figure(fraud_score, threshold):
+    """
+    Индикатор Fraud Score для результата предсказания.
     
-    with col1:
-        st.info(f"**Тип модели:** {model_info.get('model_type', 'Unknown')}")
-        st.info(f"**F1-Score:** {model_info.get('f1_score', 'N/A'):.4f}")
+    Фигура строится один раз за сессию и хранится в st.session_state; при новом
+    предсказании меняются только значение и порог. Фигура не делится между
+    сессиями, поэтому одновременные пользователи не видят чужих значений.
+    """
+    fig = st.session_state.get("gauge_figure")
+    if fig is None:
+        import plotly.graph_objects as go
         
-    with col2:
-        st.info(f"**Дата обучения:** {model_info.get('training_date', 'Unknown')}")
-        st.info(f"**Размер обучающей выборки:** {model_info.get('training_samples', 'N/A')}")
+        fig = go.Figure(go.Indicator(
+            mode = "gauge+number+delta",
+            value = fraud_score,
+            domain = {'x': [0, 1], 'y': [0, 1]},
+            title = {'text': "Fraud Score"},
+            delta = {'reference': threshold},
+            gauge = {
+                'axis': {'range': [None, 1]},
+                'bar': {'color': "darkblue"},
+                'steps': [
+                    {'range': [0, 0.3], 'color': "lightgreen"},
+                    {'range': [0.3, 0.7], 'color': "yellow"},
+                    {'range': [0.7, 1], 'color': "red"}
+                ],
+                'threshold': {
+                    'line': {'color': "red", 'width': 4},
+                    'thickness': 0.75,
+                    'value': threshold
+                }
+            }
+        ))
+        fig.update_layout(height=400)
+        st.session_state.gauge_figure = fig
+        return fig
+    
+    indicator = fig.data[0]
+    indicator.value = fraud_score
+    indicator.delta.reference = threshold
+    indicator.gauge.threshold.value = threshold
+    return fig
 
-# Страница: Предсказание
-elif page == "🔮 Предсказание":
+# Страницы-фрагменты: взаимодействие с ними перезапускает только сам фрагмент,
+# а не весь скрипт (боковую панель, проверку статуса и остальные страницы)
+@st.fragment
+def prediction_page(model):
+    """Страница ручного предсказания мошенничества."""
     st.header("🔮 Предсказание мошенничества")
     
     if model is None:
         st.error("Модель не загружена.")
-        st.stop()
+        return
     
     st.markdown("Введите параметры транзакции для получения предсказания:")
     
@@ -215,58 +272,19 @@ elif page == "🔮 Предсказание":
     with st.form("prediction_form"):
         st.subheader("📝 Параметры транзакции")
         
-        # Создаем колонки для удобного ввода
-        col1, col2, col3, col4 = st.columns(4)
-        
-        # V1-V7
-        with col1:
-            v1 = st.number_input("V1", value=0.0, format="%.6f")
-            v2 = st.number_input("V2", value=0.0, format="%.6f")
-            v3 = st.number_input("V3", value=0.0, format="%.6f")
-            v4 = st.number_input("V4", value=0.0, format="%.6f")
-            v5 = st.number_input("V5", value=0.0, format="%.6f")
-            v6 = st.number_input("V6", value=0.0, format="%.6f")
-            v7 = st.number_input("V7", value=0.0, format="%.6f")
-        
-        # V8-V14
-        with col2:
-            v8 = st.number_input("V8", value=0.0, format="%.6f")
-            v9 = st.number_input("V9", value=0.0, format="%.6f")
-            v10 = st.number_input("V10", value=0.0, format="%.6f")
-            v11 = st.number_input("V11", value=0.0, format="%.6f")
-            v12 = st.number_input("V12", value=0.0, format="%.6f")
-            v13 = st.number_input("V13", value=0.0, format="%.6f")
-            v14 = st.number_input("V14", value=0.0, format="%.6f")
-        
-        # V15-V21
-        with col3:
-            v15 = st.number_input("V15", value=0.0, format="%.6f")
-            v16 = st.number_input("V16", value=0.0, format="%.6f")
-            v17 = st.number_input("V17", value=0.0, format="%.6f")
-            v18 = st.number_input("V18", value=0.0, format="%.6f")
-            v19 = st.number_input("V19", value=0.0, format="%.6f")
-            v20 = st.number_input("V20", value=0.0, format="%.6f")
-            v21 = st.number_input("V21", value=0.0, format="%.6f")
-        
-        # V22-V28 + Amount
-        with col4:
-            v22 = st.number_input("V22", value=0.0, format="%.6f")
-            v23 = st.number_input("V23", value=0.0, format="%.6f")
-            v24 = st.number_input("V24", value=0.0, format="%.6f")
-            v25 = st.number_input("V25", value=0.0, format="%.6f")
-            v26 = st.number_input("V26", value=0.0, format="%.6f")
-            v27 = st.number_input("V27", value=0.0, format="%.6f")
-            v28 = st.number_input("V28", value=0.0, format="%.6f")
+        # Все признаки транзакции одной таблицей в одну строку
+        edited = st.data_editor(
+            pd.DataFrame([st.session_state.get("tx_defaults", _FORM_DEFAULTS)]),
+            num_rows="fixed",
+            hide_index=True,
+            use_container_width=True,
+            column_config=_FORM_COLUMN_CONFIG,
+            key=f"tx_editor_{st.session_state.get('tx_editor_version', 0)}"
+        )
         
-        # Amount и threshold
+        # Порог классификации
         st.subheader("💰 Дополнительные параметры")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            amount = st.number_input("Amount (сумма транзакции)", value=100.0, min_value=0.0, format="%.2f")
-        
-        with col2:
-            threshold = st.slider("Порог классификации", min_value=0.0, max_value=1.0, value=0.5, step=0.01)
+        threshold = st.slider("Порог классификации", min_value=0.0, max_value=1.0, value=0.5, step=0.01)
         
         # Кнопки
         col1, col2, col3 = st.columns(3)
@@ -275,29 +293,25 @@ elif page == "🔮 Предсказание":
             submitted = st.form_submit_button("🔮 Предсказать", type="primary")
         
         with col2:
-            if st.form_submit_button("🎲 Случайный пример"):
-                # Генерируем случайные значения
-                st.experimental_rerun()
+            # Генерируем случайные значения
+            st.form_submit_button("🎲 Случайный пример", on_click=set_random_form_values)
         
         with col3:
-            if st.form_submit_button("📋 Пример мошенничества"):
-                # Загружаем пример мошеннической транзакции
-                st.experimental_rerun()
+            # Загружаем пример мошеннической транзакции
+            st.form_submit_button("📋 Пример мошенничества", on_click=set_form_values, args=(_FRAUD_EXAMPLE,))
     
     # Обработка предсказания
     if submitted:
-        # Формируем данные транзакции
-        transaction_data = {
-            "V1": v1, "V2": v2, "V3": v3, "V4": v4, "V5": v5, "V6": v6, "V7": v7,
-            "V8": v8, "V9": v9, "V10": v10, "V11": v11, "V12": v12, "V13": v13, "V14": v14,
-            "V15": v15, "V16": v16, "V17": v17, "V18": v18, "V19": v19, "V20": v20, "V21": v21,
-            "V22": v22, "V23": v23, "V24": v24, "V25": v25, "V26": v26, "V27": v27, "V28": v28,
-            "Amount": amount
-        }
+        # Вектор признаков в порядке модели: Time = 0, затем V1-V28 и Amount из таблицы
+        values = np.zeros(len(FEATURE_NAMES))
+        values[1:] = edited[_FORM_FEATURES].to_numpy(dtype=np.float64)[0]
         
         try:
+            if not np.isfinite(values).all():
+                raise ValueError("Все признаки должны быть заполнены конечными числами")
+            
             # Выполняем предсказание
-            result = model.predict_detailed(transaction_data, threshold)
+            result = model.predict_array_with_details(values, threshold)
             
             # Отображаем результат
             st.subheader("🎯 Результат предсказания")
@@ -321,106 +335,196 @@ elif page == "🔮 Предсказание":
                 st.info(f"**Уровень риска:** {risk_level}")
             
             # Визуализация результата
-            fig = go.Figure(go.Indicator(
-                mode = "gauge+number+delta",
-                value = fraud_score,
-                domain = {'x': [0, 1], 'y': [0, 1]},
-                title = {'text': "Fraud Score"},
-                delta = {'reference': threshold},
-                gauge = {
-                    'axis': {'range': [None, 1]},
-                    'bar': {'color': "darkblue"},
-                    'steps': [
-                        {'range': [0, 0.3], 'color': "lightgreen"},
-                        {'range': [0.3, 0.7], 'color': "yellow"},
-                        {'range': [0.7, 1], 'color': "red"}
-                    ],
-                    'threshold': {
-                        'line': {'color': "red", 'width': 4},
-                        'thickness': 0.75,
-                        'value': threshold
-                    }
-                }
-            ))
-            
-            fig.update_layout(height=400)
+            fig = gauge_figure(fraud_score, threshold)
             st.plotly_chart(fig, use_container_width=True)
             
         except Exception as e:
             st.error(f"Ошибка предсказания: {e}")
 
-# Страница: Визуализация
-elif page == "📊 Визуализация":
+# Фигуры и таблица страницы визуализации строятся один раз на версию файла метрик
+# (mtime - ключ кэша). Объекты общие для всех сессий и только читаются при выводе
+@st.cache_resource(show_spinner=False)
+def roc_figure(mtime):
+    """ROC кривая по метрикам модели."""
+    import plotly.graph_objects as go
+    
+    metrics = load_model_metrics(mtime)
+    fpr, tpr, _ = metrics['roc_curve']
+    fpr, tpr = _downsample_roc(fpr, tpr)
+    roc_auc = metrics.get('roc_auc', 0)
+    
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=fpr, y=tpr,
+        mode='lines',
+        name=f'ROC кривая (AUC = {roc_auc:.4f})',
+        line=dict(color='blue', width=2)
+    ))
+    fig.add_trace(go.Scatter(
+        x=[0, 1], y=[0, 1],
+        mode='lines',
+        name='Случайный классификатор',
+        line=dict(color='red', dash='dash')
+    ))
+    
+    fig.update_layout(
+        title='ROC кривая',
+        xaxis_title='False Positive Rate',
+        yaxis_title='True Positive Rate',
+        width=600, height=500
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False)
+def confusion_matrix_figure(mtime):
+    """Тепловая карта Confusion Matrix по метрикам модели."""
+    import plotly.graph_objects as go
+    
+    cm = load_model_metrics(mtime)['confusion_matrix']
+    
+    fig = go.Figure(go.Heatmap(
+        z=cm,
+        x=['Не мошенничество', 'Мошенничество'],
+        y=['Не мошенничество', 'Мошенничество'],
+        colorscale='Blues',
+        text=cm,
+        texttemplate='%{text}',
+        colorbar=dict(title='Количество'),
+        hoverongaps=False
+    ))
+    
+    # Первая строка матрицы сверху, как у px.imshow
+    fig.update_layout(
+        title="Confusion Matrix",
+        xaxis_title="Предсказанный класс",
+        yaxis_title="Истинный класс",
+        yaxis_autorange='reversed'
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False)
+def metrics_table(mtime):
+    """Таблица метрик по классам из classification_report."""
+    report = load_model_metrics(mtime)['classification_report']
+    
+    # DataFrame строками по классам (accuracy - одно число, повторяется во всех колонках)
+    columns = next(v for v in report.values() if isinstance(v, dict)).keys()
+    rows = {name: v if isinstance(v, dict) else dict.fromkeys(columns, v) for name, v in report.items()}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+@st.fragment
+def visualization_page():
+    """Страница визуализации метрик модели."""
     st.header("📊 Визуализация результатов")
     
     # Загружаем метрики
-    metrics = load_model_metrics()
+    mtime = metrics_mtime()
+    metrics = load_model_metrics(mtime)
     
     if metrics is None:
         st.warning("Метрики модели не найдены. Убедитесь, что модель обучена.")
-        st.stop()
+        return
     
     # ROC кривая
     if 'roc_curve' in metrics:
         st.subheader("📈 ROC кривая")
-        
-        fpr, tpr, _ = metrics['roc_curve']
-        roc_auc = metrics.get('roc_auc', 0)
-        
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=fpr, y=tpr,
-            mode='lines',
-            name=f'ROC кривая (AUC = {roc_auc:.4f})',
-            line=dict(color='blue', width=2)
-        ))
-        fig.add_trace(go.Scatter(
-            x=[0, 1], y=[0, 1],
-            mode='lines',
-            name='Случайный классификатор',
-            line=dict(color='red', dash='dash')
-        ))
-        
-        fig.update_layout(
-            title='ROC кривая',
-            xaxis_title='False Positive Rate',
-            yaxis_title='True Positive Rate',
-            width=600, height=500
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(roc_figure(mtime), use_container_width=True)
     
     # Confusion Matrix
     if 'confusion_matrix' in metrics:
         st.subheader("🎯 Confusion Matrix")
-        
-        cm = metrics['confusion_matrix']
-        
-        fig = px.imshow(
-            cm,
-            labels=dict(x="Предсказанный класс", y="Истинный класс", color="Количество"),
-            x=['Не мошенничество', 'Мошенничество'],
-            y=['Не мошенничество', 'Мошенничество'],
-            color_continuous_scale='Blues',
-            text_auto=True
-        )
-        
-        fig.update_layout(title="Confusion Matrix")
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(confusion_matrix_figure(mtime), use_container_width=True)
     
     # Метрики по классам
     if 'classification_report' in metrics:
         st.subheader("📋 Детальные метрики")
         
-        report = metrics['classification_report']
-        
-        # Создаем DataFrame для отображения
-        df_metrics = pd.DataFrame(report).transpose()
+        df_metrics = metrics_table(mtime)
         
-        # Форматируем числа
-        df_metrics = df_metrics.round(4)
+        # Числа форматируются на стороне браузера: без Styler и без перевода в строки
+        st.dataframe(
+            df_metrics,
+            use_container_width=True,
+            column_config={col: st.column_config.NumberColumn(format="%.4f") for col in df_metrics.columns}
+        )
+
+# Боковая панель
+st.sidebar.title("🎛️ Навигация")
+
+# Проверка статуса системы
+if st.sidebar.button("🔄 Обновить статус"):
+    check_api_status.clear()
+model, model_error = load_fraud_model()
+api_status, api_info = check_api_status()
+
+# Статус системы в боковой панели: заголовок и обе карточки одним блоком
+if model is not None:
+    model_html = '<div class="success-card">✅ Модель загружена</div>'
+else:
+    model_html = f'<div class="danger-card">❌ Модель не загружена<br><small>{model_error}</small></div>'
+
+if api_status:
+    api_html = '<div class="success-card">✅ API доступен</div>'
+else:
+    api_html = '<div class="warning-card">⚠️ API недоступен</div>'
+
+st.sidebar.markdown(
+    f'### 📊 Статус системы\n\n<div style="display:flex;flex-direction:column;gap:1rem">{model_html}{api_html}</div>',
+    unsafe_allow_html=True
+)
+
+# Выбор страницы
+page = st.sidebar.selectbox(
+    "Выберите страницу:",
+    ["📈 Обзор модели", "🔮 Предсказание", "📊 Визуализация", "🧪 Тестирование API", "ℹ️ Информация"]
+)
+
+# Страница: Обзор модели
+if page == "📈 Обзор модели":
+    st.header("📈 Обзор модели")
+    
+    if model is None:
+        st.error("Модель не загружена. Убедитесь, что модель обучена и сохранена в папке model/")
+        st.info("Для обучения модели запустите: `jupyter notebook notebooks/train_model.ipynb`")
+        st.stop()
+    
+    # Информация о модели
+    model_info = load_model_info(model, model.model_dir)
+    
+    # Четыре карточки метрик одной HTML-сеткой
+    cards = "".join(
+        f'<div class="metric-card"><h3>{title}</h3><h2>{_format_metric(model_info.get(key))}</h2></div>'
+        for title, key in _OVERVIEW_CARDS
+    )
+    st.markdown(
+        f'<div style="display:grid;grid-template-columns:repeat(4,1fr);gap:1rem">{cards}</div>',
+        unsafe_allow_html=True
+    )
+    
+    # Дополнительная информация
+    st.subheader("🔧 Детали модели")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.info(
+            f"**Тип модели:** {model_info.get('model_type', 'Unknown')}  \n"
+            f"**F1-Score:** {_format_metric(model_info.get('f1_score'))}"
+        )
         
-        st.dataframe(df_metrics, use_container_width=True)
+    with col2:
+        st.info(
+            f"**Дата обучения:** {model_info.get('training_date', 'Unknown')}  \n"
+            f"**Размер обучающей выборки:** {model_info.get('training_samples', 'N/A')}"
+        )
+
+# Страница: Предсказание
+elif page == "🔮 Предсказание":
+    prediction_page(model)
+
+# Страница: Визуализация
+elif page == "📊 Визуализация":
+    visualization_page()
 
 # Страница: Тестирование API
 elif page == "🧪 Тестирование API":
@@ -448,7 +552,7 @@ elif page == "🧪 Тестирование API":
     if endpoint == "/health":
         if st.button("Тестировать /health"):
             try:
-                response = requests.get("http://localhost:5000/health")
+                response = http_session().get("http://localhost:5000/health")
                 st.success(f"Статус: {response.status_code}")
                 st.json(response.json())
             except Exception as e:
@@ -460,7 +564,7 @@ elif page == "🧪 Тестирование API":
         # Получаем пример транзакции
         if st.button("Получить пример транзакции"):
             try:
-                response = requests.get("http://localhost:5000/sample-transaction")
+                response = http_session().get("http://localhost:5000/sample-transaction")
                 if response.status_code == 200:
                     sample = response.json()["sample_transaction"]
                     st.session_state.sample_transaction = sample
@@ -472,7 +576,7 @@ elif page == "🧪 Тестирование API":
         # Тестируем предсказание
         if st.button("Тестировать предсказание") and hasattr(st.session_state, 'sample_transaction'):
             try:
-                response = requests.post(
+                response = http_session().post(
                     "http://localhost:5000/predict",
                     json=st.session_state.sample_transaction
                 )
@@ -484,7 +588,7 @@ elif page == "🧪 Тестирование API":
     elif endpoint == "/model-info":
         if st.button("Тестировать /model-info"):
             try:
-                response = requests.get("http://localhost:5000/model-info")
+                response = http_session().get("http://localhost:5000/model-info")
                 st.success(f"Статус: {response.status_code}")
                 st.json(response.json())
             except Exception as e:
@@ -493,7 +597,7 @@ elif page == "🧪 Тестирование API":
     elif endpoint == "/sample-transaction":
         if st.button("Тестировать /sample-transaction"):
             try:
-                response = requests.get("http://localhost:5000/sample-transaction")
+                response = http_session().get("http://localhost:5000/sample-transaction")
                 st.success(f"Статус: {response.status_code}")
                 st.json(response.json())
             except Exception as e:
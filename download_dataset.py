@@ -2,6 +2,53 @@ import kagglehub
 import shutil
 import os
 
+# Сколько байт с начала и с конца файла сравнивается при проверке актуальности
+EDGE_CHECK_BYTES = 1 << 20
+
+def same_edges(source_file, dest_file, size):
+    """Совпадают ли первые и последние EDGE_CHECK_BYTES байт двух файлов одного размера."""
+    with open(source_file, 'rb') as src, open(dest_file, 'rb') as dst:
+        if src.read(EDGE_CHECK_BYTES) != dst.read(EDGE_CHECK_BYTES):
+            return False
+        tail = max(size - EDGE_CHECK_BYTES, 0)
+        src.seek(tail)
+        dst.seek(tail)
+        return src.read() == dst.read()
+
+def is_up_to_date(source_file, dest_file):
+    """
+    Файл в data/ уже совпадает с файлом кэша: та же жесткая ссылка, либо тот же
+    размер, не старше и одинаковые начало и конец файла.
+    """
+    try:
+        dest_stat = os.stat(dest_file)
+    except FileNotFoundError:
+        return False
+    source_stat = os.stat(source_file)
+    if os.path.samestat(source_stat, dest_stat):
+        return True
+    return (dest_stat.st_size == source_stat.st_size
+            and int(dest_stat.st_mtime) >= int(source_stat.st_mtime)
+            and same_edges(source_file, dest_file, source_stat.st_size))
+
+def link_or_copy(source_file, dest_file):
+    """Жесткая ссылка на файл из кэша kagglehub; копирование, если ссылку создать нельзя."""
+    # Новый файл создается рядом и атомарно заменяет старый. Запись поверх старого
+    # файла изменила бы кэш kagglehub, если старый файл - жесткая ссылка на него
+    tmp_file = dest_file + ".tmp"
+    if os.path.lexists(tmp_file):
+        os.remove(tmp_file)
+    try:
+        # Байты не копируются
+        os.link(source_file, tmp_file)
+        method = "link"
+    except OSError:
+        # Другая файловая система или ссылки не поддерживаются
+        shutil.copy2(source_file, tmp_file)
+        method = "copy"
+    os.replace(tmp_file, dest_file)
+    return method
+
 # Download latest version
 print("Скачиваем датасет Credit Card Fraud Detection...")
 path = kagglehub.dataset_download("mlg-ulb/creditcardfraud")
@@ -19,8 +66,14 @@ for file in os.listdir(path):
         source_file = os.path.join(path, file)
         dest_file = os.path.join(data_folder, file)
         
+        if is_up_to_date(source_file, dest_file):
+            print(f"{file} уже есть в папке data/, пропускаем")
+            continue
+        
         print(f"Копируем {file} в папку data/")
-        shutil.copy2(source_file, dest_file)
-        print(f"Датасет успешно скопирован: {dest_file}")
+        if link_or_copy(source_file, dest_file) == "link":
+            print(f"Датасет успешно связан (жесткая ссылка): {dest_file}")
+        else:
+            print(f"Датасет успешно скопирован: {dest_file}")
 
 print("Готово! Датасет находится в папке data/")
\ No newline at end of file
@@ -10,12 +10,64 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+import io
 import json
-from datetime import datetime
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Базовый URL API
 BASE_URL = "http://localhost:5000"
 
+# Таймауты запросов: (подключение, чтение) в секундах
+REQUEST_TIMEOUT = (3, 30)
+
+# Таймауты проверки доступности API: недоступный сервер обнаруживается быстро
+HEALTH_CONNECT_TIMEOUT = 0.5
+HEALTH_TIMEOUT = (HEALTH_CONNECT_TIMEOUT, 2)
+
+# Одна сессия на все запросы: соединения с API переиспользуются (keep-alive)
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Тела запросов кодируются заранее и отправляются как готовые байты
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    def _dumps(obj):
+        """JSON в байтах UTF-8."""
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    _loads = json.loads
+
+# Кэш ответов в пределах одного запуска: (URL, тело запроса) -> ответ
+_response_cache = {}
+_response_cache_lock = threading.Lock()
+
+# Количество разделов тестирования, выполняемых одновременно
+MAX_PARALLEL_SECTIONS = 5
+
+# Примеры печатают только начало длинных текстов: сервер сразу отдает
+# нужные поля с обрезанными строками (query-параметры fields и text_limit)
+TEXT_PREVIEW_LENGTH = 200
+EXPLAIN_BATCH_QUERY = (
+    "?fields=per_language,similar_cases,anomalies,fraud_score,is_fraud"
+    f"&text_limit={TEXT_PREVIEW_LENGTH}"
+)
+CHAT_QUERY = f"?text_limit={TEXT_PREVIEW_LENGTH}"
+
 # Пример транзакции для тестирования
 SAMPLE_TRANSACTION = {
     "V1": -1.3598071336738,
@@ -49,6 +101,133 @@ SAMPLE_TRANSACTION = {
     "Amount": 149.62
 }
 
+# Пример транзакции, закодированный один раз для всех запросов
+SAMPLE_TRANSACTION_JSON = _dumps(SAMPLE_TRANSACTION)
+
+def transaction_payload(**fields):
+    """
+    Тело запроса {"transaction": SAMPLE_TRANSACTION, **fields} в байтах.
+    
+    Транзакция подставляется из SAMPLE_TRANSACTION_JSON без повторного
+    кодирования, кодируются только дополнительные поля.
+    """
+    body = b'{"transaction":' + SAMPLE_TRANSACTION_JSON
+    if not fields:
+        return body + b'}'
+    return body + b',' + _dumps(fields)[1:]
+
+def _encode(payload):
+    """Тело запроса в байтах (готовые байты передаются как есть)."""
+    return payload if isinstance(payload, bytes) else _dumps(payload)
+
+def post_json(url, payload):
+    """POST-запрос с JSON телом: словарь (кодируется orjson, если установлен) или байты."""
+    return SESSION.post(url, data=_encode(payload), headers=JSON_HEADERS, timeout=REQUEST_TIMEOUT)
+
+def response_json(response):
+    """Разбор JSON ответа (orjson, если установлен)."""
+    return _loads(response.content)
+
+def cached_post(url, payload):
+    """
+    POST-запрос с кэшированием успешных ответов на время запуска.
+    
+    Только для запросов без состояния и побочных эффектов, ответы которых
+    не зависят от истории случаев (не для /chat, /feedback, /similar-cases
+    и /explain/enhanced).
+    
+    Args:
+        url: URL эндпоинта
+        payload: Тело запроса (словарь или байты)
+        
+    Returns:
+        requests.Response: Ответ (из кэша, если такой запрос уже выполнялся)
+    """
+    body = _encode(payload)
+    key = (url, body)
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    response = post_json(url, body)
+    if response.status_code == 200:
+        with _response_cache_lock:
+            _response_cache[key] = response
+    return response
+
+def safe_post(url, payload, cached=False):
+    """
+    POST-запрос с разбором ответа и перехватом ошибок.
+    
+    Args:
+        url: URL эндпоинта
+        payload: Тело запроса (словарь или байты)
+        cached: Использовать ли кэш ответов (см. cached_post)
+        
+    Returns:
+        tuple: (True, разобранный JSON) при коде 200, иначе (False, текст ошибки)
+    """
+    try:
+        response = cached_post(url, payload) if cached else post_json(url, payload)
+        if response.status_code == 200:
+            return True, response_json(response)
+        return False, f"Ошибка: {response.status_code} - {response.text}"
+    except Exception as e:
+        return False, f"Исключение: {e}"
+
+def check_api_available():
+    """
+    Быстрая проверка доступности API.
+    
+    Сначала проверяется TCP-подключение к порту сервера, затем /health
+    запрашивается методом HEAD (без тела ответа).
+    
+    Returns:
+        str: Текст ошибки или None, если API доступен
+    """
+    url = urlsplit(BASE_URL)
+    try:
+        with socket.create_connection((url.hostname, url.port or 80), timeout=HEALTH_CONNECT_TIMEOUT):
+            pass
+        health_response = SESSION.head(f"{BASE_URL}/health", timeout=HEALTH_TIMEOUT)
+    except Exception as e:
+        return f"Не удается подключиться к API: {e}"
+    if health_response.status_code != 200:
+        return "API недоступен. Убедитесь, что сервер запущен."
+    return None
+
+class _SectionOutput(io.TextIOBase):
+    """sys.stdout, перенаправляющий вывод потока в его буфер (если он задан)."""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer or self._stream).write(text)
+    
+    def flush(self):
+        self._stream.flush()
+    
+    def capture(self, section):
+        """
+        Выполнение раздела с накоплением его вывода.
+        
+        Args:
+            section: Функция раздела тестирования
+            
+        Returns:
+            str: Все, что раздел напечатал
+        """
+        self._local.buffer = io.StringIO()
+        try:
+            section()
+            return self._local.buffer.getvalue()
+        finally:
+            self._local.buffer = None
+
 def test_enhanced_explanation():
     """Тестирование расширенного объяснения."""
     print("=== ТЕСТИРОВАНИЕ РАСШИРЕННОГО ОБЪЯСНЕНИЯ ===")
@@ -56,92 +235,68 @@ def test_enhanced_explanation():
     # Тестируем на разных языках
     languages = ['ru', 'en', 'kk']
     
+    # Все языки одним запросом: предсказание и поиск случаев выполняются один раз
+    payload = transaction_payload(threshold=0.5, languages=languages)
+    
+    ok, result = safe_post(f"{BASE_URL}/explain/enhanced/batch{EXPLAIN_BATCH_QUERY}", payload)
+    if not ok:
+        print(f"❌ {result}")
+        return
+    
     for lang in languages:
         print(f"\n--- Язык: {lang} ---")
-        
-        payload = {
-            "transaction": SAMPLE_TRANSACTION,
-            "threshold": 0.5,
-            "language": lang
-        }
-        
-        try:
-            response = requests.post(f"{BASE_URL}/explain/enhanced", json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ Успешно получено объяснение")
-                print(f"Fraud Score: {result.get('fraud_score', 'N/A')}")
-                print(f"Is Fraud: {result.get('is_fraud', 'N/A')}")
-                print(f"Похожих случаев найдено: {len(result.get('similar_cases', []))}")
-                print(f"Аномалий обнаружено: {len(result.get('anomalies', {}).get('detected_anomalies', []))}")
-                print(f"Рекомендаций: {len(result.get('recommendations', []))}")
-                print(f"Объяснение (первые 200 символов): {result.get('explanation', '')[:200]}...")
-            else:
-                print(f"❌ Ошибка: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            print(f"❌ Исключение: {e}")
+        explained = result['per_language'][lang]
+        print(f"✅ Успешно получено объяснение")
+        print(f"Fraud Score: {result.get('fraud_score', 'N/A')}")
+        print(f"Is Fraud: {result.get('is_fraud', 'N/A')}")
+        print(f"Похожих случаев найдено: {len(result.get('similar_cases', []))}")
+        print(f"Аномалий обнаружено: {len(result.get('anomalies', {}).get('detected_anomalies', []))}")
+        print(f"Рекомендаций: {len(explained.get('recommendations', []))}")
+        print(f"Объяснение (первые {TEXT_PREVIEW_LENGTH} символов): {explained.get('explanation', '')[:TEXT_PREVIEW_LENGTH]}...")
 
 def test_similar_cases():
     """Тестирование поиска похожих случаев."""
     print("\n=== ТЕСТИРОВАНИЕ ПОИСКА ПОХОЖИХ СЛУЧАЕВ ===")
     
-    payload = {
-        "transaction": SAMPLE_TRANSACTION,
-        "top_k": 5
-    }
+    payload = transaction_payload(top_k=5)
     
-    try:
-        response = requests.post(f"{BASE_URL}/similar-cases", json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Найдено похожих случаев: {result.get('total_found', 0)}")
-            
-            for i, case in enumerate(result.get('similar_cases', []), 1):
-                print(f"  {i}. ID: {case.get('id', 'N/A')}")
-                print(f"     Описание: {case.get('description', 'N/A')}")
-                print(f"     Тип паттерна: {case.get('pattern_type', 'N/A')}")
-                print(f"     Риск скор: {case.get('risk_score', 'N/A')}")
-                print(f"     Мошенничество: {case.get('is_fraud', 'N/A')}")
-        else:
-            print(f"❌ Ошибка: {response.status_code} - {response.text}")
-            
-    except Exception as e:
-        print(f"❌ Исключение: {e}")
+    ok, result = safe_post(f"{BASE_URL}/similar-cases", payload)
+    if not ok:
+        print(f"❌ {result}")
+        return
+    
+    print(f"✅ Найдено похожих случаев: {result.get('total_found', 0)}")
+    
+    for i, case in enumerate(result.get('similar_cases', []), 1):
+        print(f"  {i}. ID: {case.get('id', 'N/A')}")
+        print(f"     Описание: {case.get('description', 'N/A')}")
+        print(f"     Тип паттерна: {case.get('pattern_type', 'N/A')}")
+        print(f"     Риск скор: {case.get('risk_score', 'N/A')}")
+        print(f"     Мошенничество: {case.get('is_fraud', 'N/A')}")
 
 def test_anomaly_analysis():
     """Тестирование анализа аномалий."""
     print("\n=== ТЕСТИРОВАНИЕ АНАЛИЗА АНОМАЛИЙ ===")
     
-    payload = {
-        "transaction": SAMPLE_TRANSACTION,
-        "threshold": 0.5
-    }
+    payload = transaction_payload(threshold=0.5)
     
-    try:
-        response = requests.post(f"{BASE_URL}/analyze-anomalies", json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            anomalies = result.get('anomalies', {})
-            
-            print(f"✅ Анализ аномалий завершен")
-            print(f"Fraud Score: {result.get('fraud_score', 'N/A')}")
-            print(f"Уровень серьезности: {anomalies.get('severity_level', 'N/A')}")
-            print(f"Скор аномалий: {anomalies.get('anomaly_score', 'N/A')}")
-            print(f"Типы паттернов: {', '.join(anomalies.get('pattern_types', []))}")
-            
-            detected = anomalies.get('detected_anomalies', [])
-            print(f"Обнаруженные аномалии ({len(detected)}):")
-            for anomaly in detected:
-                print(f"  - {anomaly.get('type', 'N/A')}: {anomaly.get('description', 'N/A')} ({anomaly.get('severity', 'N/A')})")
-        else:
-            print(f"❌ Ошибка: {response.status_code} - {response.text}")
-            
-    except Exception as e:
-        print(f"❌ Исключение: {e}")
+    ok, result = safe_post(f"{BASE_URL}/analyze-anomalies", payload, cached=True)
+    if not ok:
+        print(f"❌ {result}")
+        return
+    
+    anomalies = result.get('anomalies', {})
+    
+    print(f"✅ Анализ аномалий завершен")
+    print(f"Fraud Score: {result.get('fraud_score', 'N/A')}")
+    print(f"Уровень серьезности: {anomalies.get('severity_level', 'N/A')}")
+    print(f"Скор аномалий: {anomalies.get('anomaly_score', 'N/A')}")
+    print(f"Типы паттернов: {', '.join(anomalies.get('pattern_types', []))}")
+    
+    detected = anomalies.get('detected_anomalies', [])
+    print(f"Обнаруженные аномалии ({len(detected)}):")
+    for anomaly in detected:
+        print(f"  - {anomaly.get('type', 'N/A')}: {anomaly.get('description', 'N/A')} ({anomaly.get('severity', 'N/A')})")
 
 def test_recommendations():
     """Тестирование получения рекомендаций."""
@@ -149,71 +304,54 @@ def test_recommendations():
     
     languages = ['ru', 'en', 'kk']
     
+    # Все языки одним запросом
+    payload = transaction_payload(threshold=0.5, languages=languages)
+    
+    ok, result = safe_post(f"{BASE_URL}/recommendations/batch", payload)
+    if not ok:
+        print(f"❌ {result}")
+        return
+    
     for lang in languages:
         print(f"\n--- Рекомендации на языке: {lang} ---")
+        recommendations = result['per_language'][lang].get('recommendations', [])
         
-        payload = {
-            "transaction": SAMPLE_TRANSACTION,
-            "threshold": 0.5,
-            "language": lang
-        }
+        print(f"✅ Получено рекомендаций: {len(recommendations)}")
+        print(f"Fraud Score: {result.get('fraud_score', 'N/A')}")
+        print(f"Risk Level: {result.get('risk_level', 'N/A')}")
         
-        try:
-            response = requests.post(f"{BASE_URL}/recommendations", json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                recommendations = result.get('recommendations', [])
-                
-                print(f"✅ Получено рекомендаций: {len(recommendations)}")
-                print(f"Fraud Score: {result.get('fraud_score', 'N/A')}")
-                print(f"Risk Level: {result.get('risk_level', 'N/A')}")
-                
-                for i, rec in enumerate(recommendations, 1):
-                    print(f"  {i}. [{rec.get('type', 'N/A')}] {rec.get('action', 'N/A')}")
-            else:
-                print(f"❌ Ошибка: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            print(f"❌ Исключение: {e}")
+        for i, rec in enumerate(recommendations, 1):
+            print(f"  {i}. [{rec.get('type', 'N/A')}] {rec.get('action', 'N/A')}")
 
 def test_feedback():
     """Тестирование системы обратной связи."""
     print("\n=== ТЕСТИРОВАНИЕ ОБРАТНОЙ СВЯЗИ ===")
     
     # Сначала получаем предсказание
-    try:
-        pred_response = requests.post(f"{BASE_URL}/predict", json=SAMPLE_TRANSACTION)
-        
-        if pred_response.status_code == 200:
-            prediction_result = pred_response.json()
-            
-            # Отправляем положительную обратную связь
-            feedback_payload = {
-                "transaction": SAMPLE_TRANSACTION,
-                "prediction_result": prediction_result,
-                "feedback": True  # Правильное предсказание
-            }
-            
-            feedback_response = requests.post(f"{BASE_URL}/feedback", json=feedback_payload)
-            
-            if feedback_response.status_code == 200:
-                result = feedback_response.json()
-                print(f"✅ Обратная связь отправлена: {result.get('message', 'N/A')}")
-                print(f"Feedback: {result.get('feedback', 'N/A')}")
-            else:
-                print(f"❌ Ошибка отправки feedback: {feedback_response.status_code}")
-        else:
-            print(f"❌ Ошибка получения предсказания: {pred_response.status_code}")
-            
-    except Exception as e:
-        print(f"❌ Исключение: {e}")
+    ok, prediction_result = safe_post(f"{BASE_URL}/predict", SAMPLE_TRANSACTION_JSON)
+    if not ok:
+        print(f"❌ Ошибка получения предсказания: {prediction_result}")
+        return
+    
+    # Отправляем положительную обратную связь
+    feedback_payload = transaction_payload(
+        prediction_result=prediction_result,
+        feedback=True  # Правильное предсказание
+    )
+    
+    ok, result = safe_post(f"{BASE_URL}/feedback", feedback_payload)
+    if not ok:
+        print(f"❌ Ошибка отправки feedback: {result}")
+        return
+    
+    print(f"✅ Обратная связь отправлена: {result.get('message', 'N/A')}")
+    print(f"Feedback: {result.get('feedback', 'N/A')}")
 
 def test_chatbot():
     """Тестирование чат-бота."""
     print("\n=== ТЕСТИРОВАНИЕ ЧАТ-БОТА ===")
     
-    session_id = f"test_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    session_id = f"test_session_{time.monotonic_ns()}"
     
     # Тестовые сообщения на разных языках
     test_messages = [
@@ -223,42 +361,32 @@ def test_chatbot():
         {"message": "Можешь проанализировать мою транзакцию?", "language": "ru"}
     ]
     
-    for i, test_msg in enumerate(test_messages, 1):
-        print(f"\n--- Сообщение {i} ({test_msg['language']}) ---")
-        
-        payload = {
-            "message": test_msg["message"],
-            "session_id": session_id,
-            "language": test_msg["language"]
-        }
-        
-        # Для последнего сообщения добавляем контекст транзакции
-        if i == len(test_messages):
-            payload["transaction_context"] = {
-                "transaction": SAMPLE_TRANSACTION,
-                "result": {"fraud_score": 0.85, "is_fraud": True, "risk_level": "high"}
-            }
-        
-        try:
-            response = requests.post(f"{BASE_URL}/chat", json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ Ответ получен")
-                print(f"Сообщение: {test_msg['message']}")
-                print(f"Ответ: {result.get('response', 'N/A')[:200]}...")
-                print(f"Предложения: {len(result.get('suggestions', []))} шт.")
-            else:
-                print(f"❌ Ошибка: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            print(f"❌ Исключение: {e}")
+    # Для последнего сообщения добавляем контекст транзакции
+    test_messages[-1]["transaction_context"] = {
+        "transaction": SAMPLE_TRANSACTION,
+        "result": {"fraud_score": 0.85, "is_fraud": True, "risk_level": "high"}
+    }
+    
+    # Все сообщения одним запросом: сервер обрабатывает их по порядку в одной сессии
+    payload = {"session_id": session_id, "messages": test_messages}
+    ok, result = safe_post(f"{BASE_URL}/chat/batch{CHAT_QUERY}", payload)
+    if not ok:
+        print(f"❌ {result}")
+    else:
+        for i, (test_msg, reply) in enumerate(zip(test_messages, result.get('responses', [])), 1):
+            print(f"\n--- Сообщение {i} ({test_msg['language']}) ---")
+            print(f"✅ Ответ получен")
+            print(f"Сообщение: {test_msg['message']}")
+            print(f"Ответ: {reply.get('response', 'N/A')[:TEXT_PREVIEW_LENGTH]}...")
+            print(f"Предложения: {len(reply.get('suggestions', []))} шт.")
+        if result.get('error'):
+            print(f"❌ Ошибка: {result['error']}")
     
     # Получаем статистику чат-бота
     try:
-        stats_response = requests.get(f"{BASE_URL}/chat/stats")
+        stats_response = SESSION.get(f"{BASE_URL}/chat/stats", timeout=REQUEST_TIMEOUT)
         if stats_response.status_code == 200:
-            stats = stats_response.json()
+            stats = response_json(stats_response)
             print(f"\n--- Статистика чат-бота ---")
             print(f"Всего сессий: {stats.get('total_sessions', 0)}")
             print(f"Активных сессий: {stats.get('active_sessions', 0)}")
@@ -268,7 +396,7 @@ def test_chatbot():
     
     # Очищаем тестовую сессию
     try:
-        clear_response = requests.delete(f"{BASE_URL}/chat/clear/{session_id}")
+        clear_response = SESSION.delete(f"{BASE_URL}/chat/clear/{session_id}", timeout=REQUEST_TIMEOUT)
         if clear_response.status_code == 200:
             print(f"✅ Сессия {session_id} очищена")
     except Exception as e:
@@ -276,30 +404,51 @@ def test_chatbot():
 
 def main():
     """Запуск всех тестов."""
-    print("🚀 ТЕСТИРОВАНИЕ РАСШИРЕННЫХ API ФУНКЦИЙ")
-    print("=" * 50)
-    
-    # Проверяем доступность API
     try:
-        health_response = requests.get(f"{BASE_URL}/health", timeout=5)
-        if health_response.status_code != 200:
-            print("❌ API недоступен. Убедитесь, что сервер запущен.")
+        print("🚀 ТЕСТИРОВАНИЕ РАСШИРЕННЫХ API ФУНКЦИЙ")
+        print("=" * 50)
+        
+        # Проверяем доступность API
+        error = check_api_available()
+        if error:
+            print(f"❌ {error}")
             return
         print("✅ API доступен")
-    except Exception as e:
-        print(f"❌ Не удается подключиться к API: {e}")
-        return
-    
-    # Запускаем тесты
-    test_enhanced_explanation()
-    test_similar_cases()
-    test_anomaly_analysis()
-    test_recommendations()
-    test_feedback()
-    test_chatbot()
-    
-    print("\n" + "=" * 50)
-    print("🎉 ТЕСТИРОВАНИЕ ЗАВЕРШЕНО")
+        
+        # Разделы обращаются к независимым эндпоинтам и выполняются
+        # одновременно; вывод каждого печатается целиком в исходном порядке
+        output = _SectionOutput(sys.stdout)
+        sections = [
+            test_enhanced_explanation,
+            test_similar_cases,
+            test_anomaly_analysis,
+            test_recommendations,
+            test_feedback,
+            test_chatbot,
+        ]
+        sys.stdout = output
+        try:
+            with ThreadPoolExecutor(max_workers=MAX_PARALLEL_SECTIONS) as pool:
+                futures = {
+                    section: pool.submit(output.capture, section)
+                    for section in sections if section is not test_feedback
+                }
+            # Обратная связь добавляет случай в базу и меняет результаты
+            # поиска похожих случаев, поэтому выполняется после остальных
+            feedback_output = output.capture(test_feedback)
+        finally:
+            sys.stdout = output._stream
+        
+        for section in sections:
+            if section is test_feedback:
+                print(feedback_output, end="")
+            else:
+                print(futures[section].result(), end="")
+        
+        print("\n" + "=" * 50)
+        print("🎉 ТЕСТИРОВАНИЕ ЗАВЕРШЕНО")
+    finally:
+        SESSION.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,34 @@
+"""
+Конфигурация gunicorn для Flask API системы детекции мошенничества.
+
+Параметры можно переопределить переменными окружения:
+- PORT: порт (по умолчанию 5000)
+- WEB_CONCURRENCY: количество процессов-воркеров (по умолчанию число CPU)
+- GUNICORN_THREADS: количество потоков в каждом воркере (по умолчанию 4)
+- GUNICORN_KEEPALIVE: сколько секунд держать keep-alive соединение (по умолчанию 30)
+"""
+
+import multiprocessing
+import os
+
+# Ограничиваем внутренние пулы потоков numpy/sklearn, чтобы воркеры
+# не конкурировали друг с другом за ядра процессора
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+# Клиенты (дашборд, примеры) переиспользуют соединения между запросами;
+# в gthread простаивающее соединение не занимает поток воркера
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "30"))
+
+# Модель загружается один раз в master-процессе и разделяется
+# с воркерами через copy-on-write после fork
+preload_app = True
+
+timeout = 120
+accesslog = "-"